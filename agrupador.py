@@ -0,0 +1,88 @@
+"""
+Agrupación de notificaciones de cambio de estado por destinatario.
+
+Cuando un administrador revisa varias solicitudes seguidas, cada cambio de estado
+se retiene durante una ventana corta (`ventana` segundos desde el primer aviso
+pendiente de ese destinatario). Al vencer la ventana se llama una sola vez a
+`enviar_lote(destinatario, avisos)` con todos los avisos acumulados, de modo que
+el servidor SMTP recibe una transacción por persona en lugar de una por solicitud.
+Los avisos urgentes no esperan: se envían en el momento junto con lo que ya
+estuviera pendiente para ese destinatario.
+"""
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AgrupadorNotificaciones:
+
+    def __init__(self, enviar_lote, ventana=30.0):
+        self.enviar_lote = enviar_lote
+        self.ventana = ventana
+        # destinatario -> (vence_en, {solicitud_id: aviso})
+        self._pendientes = {}
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._detener = False
+
+    def encolar(self, destinatario, solicitud_id, aviso, urgente=False):
+        """
+        Retiene `aviso` para `destinatario`. Si la misma solicitud cambia de nuevo
+        dentro de la ventana solo se notifica el último estado.
+        """
+        if urgente or self.ventana <= 0:
+            with self._condicion:
+                _, avisos = self._pendientes.pop(destinatario, (None, {}))
+            avisos[solicitud_id] = aviso
+            self._enviar(destinatario, avisos)
+            return
+        with self._condicion:
+            if self._hilo is None:
+                self._iniciar()
+            _, avisos = self._pendientes.setdefault(
+                destinatario, (time.monotonic() + self.ventana, {}))
+            avisos[solicitud_id] = aviso
+            self._condicion.notify()
+
+    def _iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, name='agrupador-notificaciones', daemon=True)
+        self._hilo.start()
+        atexit.register(self.vaciar)
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                while not self._detener:
+                    ahora = time.monotonic()
+                    vencidos = [d for d, (vence_en, _) in self._pendientes.items() if vence_en <= ahora]
+                    if vencidos:
+                        break
+                    proximo = min((v for v, _ in self._pendientes.values()), default=None)
+                    self._condicion.wait(None if proximo is None else proximo - ahora)
+                if self._detener:
+                    return
+                lotes = [(d, self._pendientes.pop(d)[1]) for d in vencidos]
+            # El envío SMTP se hace fuera del candado
+            for destinatario, avisos in lotes:
+                self._enviar(destinatario, avisos)
+
+    def _enviar(self, destinatario, avisos):
+        try:
+            self.enviar_lote(destinatario, list(avisos.values()))
+        except Exception:
+            # Un fallo de SMTP no debe detener el hilo ni perder los demás lotes
+            logger.exception('No se pudo enviar el aviso de %d solicitud(es) a %s (ids: %s)',
+                             len(avisos), destinatario, ', '.join(str(i) for i in avisos))
+
+    def vaciar(self):
+        """Envía ya todo lo pendiente (al apagar el proceso) y detiene el hilo."""
+        with self._condicion:
+            self._detener = True
+            lotes = list(self._pendientes.items())
+            self._pendientes.clear()
+            self._condicion.notify()
+        for destinatario, (_, avisos) in lotes:
+            self._enviar(destinatario, avisos)
@@ -0,0 +1,181 @@
+"""
+Agregados precalculados para analítica de solicitudes.
+
+- `analitica_estados`: cuántas solicitudes creadas en cada día/mes y de cada tipo
+  están en cada estado. Se ajusta +1/-1 en cada alta y en cada cambio de estado.
+- `analitica_decisiones`: por día/mes de la decisión, tipo y estado final
+  (Aprobado/Rechazado), número de decisiones y suma de horas desde la creación.
+
+Las funciones `registrar_*` reciben el cursor de la transacción que escribe en
+`solicitudes`, así los agregados se confirman (o se deshacen) junto con el cambio.
+El tipo es siempre el nombre canónico del diccionario `tipos` (ver esquema.py).
+"""
+from datetime import datetime
+
+import esquema
+
+ESTADOS_DECISION = ('Aprobado', 'Rechazado')
+
+
+def crear_tablas(c):
+    c.execute('''
+      CREATE TABLE IF NOT EXISTS analitica_estados (
+      granularidad TEXT,
+      periodo TEXT,
+      tipo TEXT,
+      estado TEXT,
+      cantidad INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (granularidad, periodo, tipo, estado)
+    ) WITHOUT ROWID''')
+    c.execute('''
+      CREATE TABLE IF NOT EXISTS analitica_decisiones (
+      granularidad TEXT,
+      periodo TEXT,
+      tipo TEXT,
+      estado TEXT,
+      cantidad INTEGER NOT NULL DEFAULT 0,
+      horas_total REAL NOT NULL DEFAULT 0,
+      PRIMARY KEY (granularidad, periodo, tipo, estado)
+    ) WITHOUT ROWID''')
+
+
+def _periodos(fecha_iso):
+    """('dia', 'AAAA-MM-DD') y ('mes', 'AAAA-MM') de una fecha ISO."""
+    return (('dia', fecha_iso[:10]), ('mes', fecha_iso[:7]))
+
+
+def _sumar_estado(c, fecha_iso, tipo, estado, delta):
+    for granularidad, periodo in _periodos(fecha_iso):
+        c.execute('''
+          INSERT INTO analitica_estados (granularidad, periodo, tipo, estado, cantidad)
+          VALUES (?, ?, ?, ?, ?)
+          ON CONFLICT (granularidad, periodo, tipo, estado)
+          DO UPDATE SET cantidad = cantidad + excluded.cantidad
+        ''', (granularidad, periodo, tipo or '', estado, delta))
+
+
+def _sumar_decision(c, fecha_iso, tipo, estado, horas):
+    for granularidad, periodo in _periodos(fecha_iso):
+        c.execute('''
+          INSERT INTO analitica_decisiones (granularidad, periodo, tipo, estado, cantidad, horas_total)
+          VALUES (?, ?, ?, ?, 1, ?)
+          ON CONFLICT (granularidad, periodo, tipo, estado)
+          DO UPDATE SET cantidad = cantidad + 1, horas_total = horas_total + excluded.horas_total
+        ''', (granularidad, periodo, tipo or '', estado, horas))
+
+
+def registrar_alta(c, tipo, creado_en, estado='Pendiente'):
+    """Cuenta una solicitud nueva."""
+    _sumar_estado(c, creado_en, tipo, estado, 1)
+
+
+def registrar_transicion(c, tipo, creado_en, estado_anterior, estado_nuevo, ahora=None):
+    """Mueve una solicitud de un estado a otro y, si es una decisión, registra su demora."""
+    if estado_anterior == estado_nuevo:
+        return
+    _sumar_estado(c, creado_en, tipo, estado_anterior, -1)
+    _sumar_estado(c, creado_en, tipo, estado_nuevo, 1)
+    if estado_nuevo in ESTADOS_DECISION:
+        ahora = ahora or datetime.now()
+        horas = (ahora - datetime.fromisoformat(creado_en)).total_seconds() / 3600
+        _sumar_decision(c, ahora.isoformat(), tipo, estado_nuevo, horas)
+
+
+def contar_estados(conn, tabla='solicitudes'):
+    """
+    Cantidades por (granularidad, periodo, tipo, estado) desde `tabla`, una tabla
+    con las columnas enteras (`solicitudes` o `solicitudes_todas_fisicas`). Se
+    agrupa por día, tipo_id y código de estado en SQL; los nombres y los meses se
+    resuelven sobre las filas ya agrupadas.
+    """
+    tipos = esquema.nombres_tipos(conn)
+    acumulado = {}
+    for dia, tipo_id, estado, cantidad in conn.execute(f'''
+        SELECT creado_en / {esquema.MICROS_POR_DIA}, tipo_id, estado, COUNT(*)
+        FROM {tabla} WHERE creado_en IS NOT NULL
+        GROUP BY 1, 2, 3'''):
+        tipo = tipos.get(tipo_id) or ''
+        nombre_estado = esquema.ESTADOS_POR_CODIGO[estado]
+        for granularidad, periodo in _periodos(esquema.decodificar_fecha(dia)):
+            clave = (granularidad, periodo, tipo, nombre_estado)
+            acumulado[clave] = acumulado.get(clave, 0) + cantidad
+    return acumulado
+
+
+def reconstruir(conn, tabla='solicitudes'):
+    """
+    Recalcula `analitica_estados` desde cero a partir de `tabla` (ver contar_estados).
+    `analitica_decisiones` no se toca: el esquema no guarda cuándo se decidió
+    cada solicitud, así que esas demoras solo se conocen al registrarse.
+    """
+    acumulado = contar_estados(conn, tabla)
+    with conn:
+        conn.execute('DELETE FROM analitica_estados')
+        conn.executemany(
+            'INSERT INTO analitica_estados (granularidad, periodo, tipo, estado, cantidad) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [clave + (cantidad,) for clave, cantidad in acumulado.items()])
+    return conn.execute("SELECT COALESCE(SUM(cantidad), 0) FROM analitica_estados WHERE granularidad = 'mes'").fetchone()[0]
+
+
+def _filtros(conn, desde, hasta, tipo):
+    condiciones, params = [], []
+    if desde:
+        condiciones.append('periodo >= ?')
+        params.append(desde)
+    if hasta:
+        condiciones.append('periodo <= ?')
+        params.append(hasta)
+    if tipo:
+        condiciones.append('tipo = ?')
+        # Cualquier variante escrita ("vacaciones ") se resuelve al nombre canónico
+        params.append(esquema.buscar_tipo(conn, tipo)[1] or tipo)
+    return ''.join(f' AND {cond}' for cond in condiciones), params
+
+
+def consultar(conn, granularidad='mes', desde=None, hasta=None, tipo=None):
+    """
+    Tasa de aprobación por tipo, volumen por periodo y tiempo medio de decisión.
+    `desde`/`hasta` son periodos en el formato de la granularidad (AAAA-MM o AAAA-MM-DD).
+    """
+    filtro, params = _filtros(conn, desde, hasta, tipo)
+
+    aprobacion = []
+    for tipo_, total, aprobadas, rechazadas in conn.execute(f'''
+        SELECT tipo, SUM(cantidad),
+               SUM(CASE WHEN estado = 'Aprobado' THEN cantidad ELSE 0 END),
+               SUM(CASE WHEN estado = 'Rechazado' THEN cantidad ELSE 0 END)
+        FROM analitica_estados WHERE granularidad = ?{filtro}
+        GROUP BY tipo ORDER BY tipo''', [granularidad] + params):
+        decididas = aprobadas + rechazadas
+        aprobacion.append({
+            'tipo': tipo_,
+            'total': total,
+            'aprobadas': aprobadas,
+            'rechazadas': rechazadas,
+            'tasa_aprobacion': round(aprobadas / decididas * 100, 1) if decididas else None,
+        })
+
+    volumen = [
+        {'periodo': periodo, 'tipo': tipo_, 'estado': estado, 'cantidad': cantidad}
+        for periodo, tipo_, estado, cantidad in conn.execute(f'''
+          SELECT periodo, tipo, estado, cantidad FROM analitica_estados
+          WHERE granularidad = ? AND cantidad != 0{filtro}
+          ORDER BY periodo, tipo, estado''', [granularidad] + params)
+    ]
+
+    tiempo_decision = [
+        {'periodo': periodo, 'tipo': tipo_, 'decisiones': cantidad,
+         'horas_promedio': round(horas / cantidad, 2) if cantidad else None}
+        for periodo, tipo_, cantidad, horas in conn.execute(f'''
+          SELECT periodo, tipo, SUM(cantidad), SUM(horas_total) FROM analitica_decisiones
+          WHERE granularidad = ?{filtro}
+          GROUP BY periodo, tipo ORDER BY periodo, tipo''', [granularidad] + params)
+    ]
+
+    return {
+        'granularidad': granularidad,
+        'aprobacion_por_tipo': aprobacion,
+        'volumen': volumen,
+        'tiempo_decision': tiempo_decision,
+    }
@@ -1,25 +1,71 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, request, jsonify, send_file, send_from_directory, g
 from flask_cors import CORS
 from datetime import datetime, timedelta
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.units import inch
 from dotenv import load_dotenv
 import sqlite3
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+import sys
+import csv
+import json
+import time
+import threading
+import click
+import archivo
+import auditoria
+import perfilado
+import agrupador
+import analitica
+import estados
+import instantanea
+import esquema
 
 # Cargar variables de entorno
 load_dotenv()
 
 DB = 'solicitudes.db'
 
+# Base de datos fría donde se mueven las solicitudes cerradas antiguas
+ARCHIVO_DB = os.getenv('ARCHIVO_DB', 'solicitudes_archivo.db')
+# Antigüedad mínima (días) de una solicitud cerrada para archivarla
+ARCHIVO_DIAS = int(os.getenv('ARCHIVO_DIAS', '90'))
+# Filas movidas por transacción al archivar
+ARCHIVO_LOTE = int(os.getenv('ARCHIVO_LOTE', '500'))
+
+# Registro de auditoría de /chat (base aparte para no competir con `solicitudes.db`)
+AUDITORIA_DB = os.getenv('AUDITORIA_DB', 'auditoria.db')
+registro_conversaciones = auditoria.RegistroConversaciones(
+    AUDITORIA_DB,
+    capacidad=int(os.getenv('AUDITORIA_CAPACIDAD', '10000')),
+    lote=int(os.getenv('AUDITORIA_LOTE', '500')),
+    intervalo=float(os.getenv('AUDITORIA_INTERVALO', '1.0')),
+)
+
+# Perfilado bajo demanda (cabecera X-Perfilar: <token>, ?perfilar=<token> o muestreo)
+perfilador = perfilado.Perfilador(
+    os.getenv('PERFILES_DIR', 'perfiles'),
+    muestreo=float(os.getenv('PERFILADO_MUESTREO', '0')),
+    maximo=int(os.getenv('PERFILADO_MAXIMO', '200')),
+    token=os.getenv('PERFILADO_TOKEN') or None,
+)
+
+# Ventana (segundos) para agrupar avisos de cambio de estado por destinatario; 0 = envío inmediato
+NOTIFICACION_VENTANA_SEG = float(os.getenv('NOTIFICACION_VENTANA_SEG', '30'))
+# Tipos de permiso cuyos avisos no esperan la ventana (separados por comas; sin
+# distinguir tildes, mayúsculas ni espacios, igual que el diccionario de tipos)
+NOTIFICACION_TIPOS_URGENTES = {
+    esquema.clave_tipo(t) for t in os.getenv('NOTIFICACION_TIPOS_URGENTES', '').split(',') if t.strip()
+}
+
+# Instantánea de solo lectura para lecturas pesadas del admin (0 = desactivada)
+instantanea_lectura = instantanea.Instantanea(
+    DB, ARCHIVO_DB,
+    destino=os.getenv('INSTANTANEA_DESTINO') or None,
+    max_antiguedad=float(os.getenv('INSTANTANEA_MAX_ANTIGUEDAD_SEG', '5')),
+    max_antiguedad_dura=float(os.getenv('INSTANTANEA_MAX_ANTIGUEDAD_DURA_SEG', '60')),
+    intervalo=float(os.getenv('INSTANTANEA_INTERVALO_SEG', '0')),
+    cada_escrituras=int(os.getenv('INSTANTANEA_CADA_ESCRITURAS', '50')),
+)
+
 # Simple in-memory session store
 sessions = {}
 
@@ -51,149 +97,168 @@ def limpiar_estado_preservando_correo(state: dict):
         state['correo_usuario'] = correo
         state['correo_guardado_ts'] = timestamp
 # --- DB helpers ---
-def init_db():
+def conectar():
+    """Abre la base caliente con el archivo adjunto (vista `solicitudes_todas`)."""
     conn = sqlite3.connect(DB)
+    return archivo.adjuntar(conn, ARCHIVO_DB)
+
+
+def solicitudes_pendientes(c, correo):
+    """Pendientes de `correo` (más recientes primero): filtro por el código de estado, decodificadas."""
+    c.execute(f'SELECT {esquema.LISTA_FISICAS} FROM main.solicitudes WHERE correo = ? AND estado = ? '
+              'ORDER BY id DESC', (correo, esquema.codificar_estado('Pendiente')))
+    return esquema.decodificar_filas(c, c.fetchall())
+
+
+def conectar_lectura():
+    """
+    Conexión para lecturas pesadas: la instantánea si está dentro del límite de
+    antigüedad, o la base principal si no (o si la petición trae ?fresco=1).
+    """
+    if request.args.get('fresco') != '1':
+        conn = instantanea_lectura.conectar()
+        if conn is not None:
+            return conn
+    return conectar()
+
+
+def init_db():
+    # Con varios workers arrancando a la vez, los demás esperan a que termine la migración
+    conn = sqlite3.connect(DB, timeout=60)
     c = conn.cursor()
-    c.execute('''
-      CREATE TABLE IF NOT EXISTS solicitudes (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      nombre TEXT,
-      correo TEXT,
-      tipo TEXT,
-      inicio TEXT,
-      fin TEXT,
-      motivo TEXT,
-      estado TEXT,
-      creado_en TEXT,
-      comentarios TEXT
-    )
-''')
+    # Solo tiene efecto en bases nuevas; las existentes se migran con `flask mantenimiento`
+    c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    # Bases con el esquema de texto anterior: se convierten una sola vez
+    migradas = esquema.migrar(conn)
+    # crear_vista hace DROP + CREATE: todo el DDL en una transacción de escritura
+    c.execute('BEGIN IMMEDIATE')
+    # estado/tipo codificados como enteros y fechas como enteros (ver esquema.py)
+    esquema.crear_diccionario(c)
+    c.execute(esquema.sql_crear_tabla('solicitudes'))
+    esquema.crear_vista(c)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_solicitudes_correo ON solicitudes (correo)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_solicitudes_estado ON solicitudes (estado, creado_en)')
+    analitica.crear_tablas(c)
+    conn.commit()
+    # La tabla del archivo se crea (o migra) aquí, una vez; conectar() solo la adjunta
+    c.execute('ATTACH DATABASE ? AS archivo', (ARCHIVO_DB,))
+    migradas += archivo.crear_tabla_archivo(conn)
     conn.commit()
+    if migradas:
+        # Los agregados se hicieron con los textos de antes; se rehacen con los tipos canónicos
+        archivo.crear_vista_todas(conn)
+        analitica.reconstruir(conn, 'solicitudes_todas_fisicas')
     conn.close()
 
-init_db()
+
+_db_inicializada = False
+_candado_db = threading.Lock()
+
+def asegurar_db():
+    """Crea/migra el esquema una sola vez por proceso (no al importar el módulo)."""
+    global _db_inicializada
+    if _db_inicializada:
+        return
+    # El servidor atiende en varios hilos: solo la primera petición inicializa
+    with _candado_db:
+        if _db_inicializada:
+            return
+        init_db()
+        conn = conectar()
+        if conn.execute('SELECT 1 FROM analitica_estados LIMIT 1').fetchone() is None:
+            # Primera vez con analítica: partir de los datos existentes
+            analitica.reconstruir(conn, 'solicitudes_todas_fisicas')
+        conn.close()
+        instantanea_lectura.iniciar()
+        _db_inicializada = True
 
 
-# --- Email configuration ---
+# --- Email y PDF (carga diferida) ---
 def send_email_notification(to_email, subject, body, pdf_path=None):
-    """
-    Envía correo electrónico real usando SMTP.
-    """
-    # Obtener configuración desde variables de entorno
-    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('SMTP_PORT', '587'))
-    sender_email = os.getenv('SENDER_EMAIL')
-    sender_password = os.getenv('SENDER_PASSWORD')
-    sender_name = os.getenv('SENDER_NAME', 'Sistema de Solicitudes')
-    
-    # Validar que las credenciales estén configuradas
-    if not sender_email or not sender_password or sender_password == 'tu_contraseña_aqui':
-        return False
-    
-    try:
-        # Crear mensaje
-        msg = MIMEMultipart()
-        msg['From'] = f"{sender_name} <{sender_email}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Agregar cuerpo del mensaje
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Adjuntar PDF si existe
-        if pdf_path and os.path.exists(pdf_path):
-            with open(pdf_path, "rb") as attachment:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header(
-                "Content-Disposition",
-                f"attachment; filename= {os.path.basename(pdf_path)}"
-            )
-            msg.attach(part)
-        
-        # Conectar y enviar
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        
-        return True
-        
-    except smtplib.SMTPAuthenticationError:
-        return False
-    except Exception as e:
-        return False
+    """Envía un correo; `smtplib` y `email.mime` se importan en el primer envío."""
+    import notificaciones
+    return notificaciones.send_email_notification(to_email, subject, body, pdf_path)
 
 
 def generate_pdf(solicitud_data):
-    """Genera un PDF con los detalles de la solicitud"""
-    if not os.path.exists('pdfs'):
-        os.makedirs('pdfs')
-    
-    filename = f"pdfs/solicitud_{solicitud_data['id']}.pdf"
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    elements = []
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#667eea'),
-        spaceAfter=30,
-        alignment=1
-    )
-    
-    # Título
-    title = Paragraph("📋 SOLICITUD DE PERMISO", title_style)
-    elements.append(title)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Datos de la solicitud en tabla
-    data = [
-        ['Campo', 'Valor'],
-        ['Número de Solicitud', f"#{solicitud_data['id']}"],
-        ['Nombre Completo', solicitud_data['nombre']],
-        ['Correo Electrónico', solicitud_data['correo']],
-        ['Tipo de Permiso', solicitud_data['tipo']],
-        ['Fecha de Inicio', solicitud_data['inicio']],
-        ['Fecha de Fin', solicitud_data['fin']],
-        ['Motivo', solicitud_data['motivo']],
-        ['Estado', solicitud_data['estado']],
-        ['Fecha de Creación', solicitud_data['creado_en']],
-    ]
-    
-    table = Table(data, colWidths=[2.5*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('PADDING', (0, 0), (-1, -1), 8),
-    ]))
-    
-    elements.append(table)
-    elements.append(Spacer(1, 0.5*inch))
-    
-    # Nota al pie
-    note = Paragraph(
-        "<i>Este documento es un comprobante de tu solicitud de permiso. "
-        "Guárdalo para futuras referencias.</i>",
-        styles['Normal']
-    )
-    elements.append(note)
+    """Genera el PDF de la solicitud; reportlab se importa en el primer uso."""
+    import documentos
+    return documentos.generate_pdf(solicitud_data)
+
+
+# --- Notificaciones de cambio de estado ---
+def mensaje_cambio_estado(solicitud):
+    """Asunto y cuerpo del correo individual para una solicitud Aprobada/Rechazada."""
+    nuevo_estado = solicitud['estado']
+    estado_emoji = "✅" if nuevo_estado == "Aprobado" else "❌"
+    subject = f"{estado_emoji} Solicitud de Permiso #{solicitud['id']} - {nuevo_estado}"
     
-    doc.build(elements)
-    return filename
+    if nuevo_estado == 'Aprobado':
+        body = f"""Hola {solicitud['nombre']},
+
+¡Buenas noticias! Tu solicitud de permiso ha sido APROBADA.
+
+Detalles de tu solicitud:
+- Número de solicitud: #{solicitud['id']}
+- Tipo de permiso: {solicitud['tipo']}
+- Fecha inicio: {solicitud['inicio']}
+- Fecha fin: {solicitud['fin']}
+- Motivo: {solicitud['motivo']}
+
+Tu permiso ha sido autorizado. Puedes proceder con tus planes.
+
+Saludos,
+Departamento de Recursos Humanos"""
+    else:
+        body = f"""Hola {solicitud['nombre']},
+
+Lamentamos informarte que tu solicitud de permiso ha sido RECHAZADA.
+
+Detalles de tu solicitud:
+- Número de solicitud: #{solicitud['id']}
+- Tipo de permiso: {solicitud['tipo']}
+- Fecha inicio: {solicitud['inicio']}
+- Fecha fin: {solicitud['fin']}
+- Motivo: {solicitud['motivo']}
+
+Si tienes preguntas sobre esta decisión, por favor contacta al Departamento de Recursos Humanos.
+
+Saludos,
+Departamento de Recursos Humanos"""
+    return subject, body
+
+
+def mensaje_resumen_estados(solicitudes):
+    """Asunto y cuerpo de un único correo que resume varios cambios de estado."""
+    lineas = []
+    for sol in solicitudes:
+        estado_emoji = "✅" if sol['estado'] == "Aprobado" else "❌"
+        lineas.append(f"{estado_emoji} #{sol['id']} - {sol['tipo']} ({sol['inicio']} a {sol['fin']}): {sol['estado'].upper()}")
+    subject = f"📋 {len(solicitudes)} solicitudes de permiso actualizadas"
+    body = f"""Hola {solicitudes[0]['nombre']},
+
+Se actualizó el estado de varias de tus solicitudes de permiso:
+
+""" + "\n".join(lineas) + """
+
+Si tienes preguntas sobre estas decisiones, por favor contacta al Departamento de Recursos Humanos.
+
+Saludos,
+Departamento de Recursos Humanos"""
+    return subject, body
+
+
+def enviar_avisos_estado(destinatario, solicitudes):
+    """Envía un correo individual o, si hay varias solicitudes, un resumen."""
+    if len(solicitudes) == 1:
+        subject, body = mensaje_cambio_estado(solicitudes[0])
+    else:
+        subject, body = mensaje_resumen_estados(sorted(solicitudes, key=lambda sol: sol['id']))
+    return send_email_notification(destinatario, subject, body)
+
+
+agrupador_notificaciones = agrupador.AgrupadorNotificaciones(
+    enviar_avisos_estado, ventana=NOTIFICACION_VENTANA_SEG)
 
 
 # --- Utilidades simples ---
@@ -208,6 +273,36 @@ def parse_date(s):
   return None
 
 
+# Opciones del menú principal (cuando no hay una solicitud en curso)
+OPCIONES_NUEVA = ('1', 'nueva', 'nueva solicitud', 'otro permiso')
+OPCIONES_CONSULTAR = ('2', 'consultar', 'ver solicitud', 'estado', 'consultar solicitud')
+OPCIONES_LISTAR = ('3', 'mis solicitudes', 'todas', 'listar', 'ver todas')
+OPCIONES_CANCELAR = ('cancelar', 'cancelar solicitud', 'anular')
+OPCIONES_SALIR = ('4', 'salir', 'terminar', 'adios', 'chao')
+OPCIONES_ESTADISTICAS = ('estadisticas', 'estadísticas', 'stats', 'mis estadisticas')
+OPCIONES_MENU = (OPCIONES_NUEVA + OPCIONES_CONSULTAR + OPCIONES_LISTAR + OPCIONES_CANCELAR
+                 + OPCIONES_SALIR + OPCIONES_ESTADISTICAS)
+
+
+def paso_conversacion(state, message):
+  """Nombre del paso en que está la conversación antes de procesar el mensaje."""
+  if state.get('action'):
+    return state['action']
+  if not state.get('nombre') or state.get('confirmado'):
+    if state.get('nombre') or message.strip().lower() in OPCIONES_MENU:
+      return 'menu'
+    # Sin nombre y sin opción del menú, handle_message toma el mensaje como el nombre
+    return 'nombre'
+  for campo in ('correo', 'tipo', 'inicio', 'fin', 'motivo'):
+    if not state.get(campo):
+      return campo
+  if state.get('esperando_confirmacion'):
+    return 'confirmacion'
+  if state.get('esperando_respuesta_correo'):
+    return 'envio_pdf'
+  return 'desconocido'
+
+
 # Minimal intent handler (rules)
 def handle_message(state, message):
   # state is a dict with progress fields
@@ -221,11 +316,11 @@ def handle_message(state, message):
     timestamp_guardado = state.get('correo_guardado_ts')
     
     # Menu options
-    if msg in ('1', 'nueva', 'nueva solicitud', 'otro permiso'):
+    if msg in OPCIONES_NUEVA:
       # Reset state for new request
       limpiar_estado_preservando_correo(state)
       return {'reply': 'Perfecto, iniciemos una nueva solicitud. Por favor dime tu nombre completo.', 'state': state}
-    elif msg in ('2', 'consultar', 'ver solicitud', 'estado', 'consultar solicitud'):
+    elif msg in OPCIONES_CONSULTAR:
       limpiar_estado_preservando_correo(state)
       state['action'] = 'consultar'
       state['next_action'] = True
@@ -233,7 +328,7 @@ def handle_message(state, message):
       # Mostrar las últimas solicitudes como ayuda
       conn = sqlite3.connect(DB)
       c = conn.cursor()
-      c.execute('SELECT id, nombre, tipo, estado FROM solicitudes ORDER BY id DESC LIMIT 10')
+      c.execute('SELECT id, nombre, tipo, estado FROM solicitudes_v ORDER BY id DESC LIMIT 10')
       rows = c.fetchall()
       conn.close()
       
@@ -245,7 +340,7 @@ def handle_message(state, message):
         return {'reply': mensaje, 'state': state}
       else:
         return {'reply': 'No hay solicitudes registradas aún. Por favor ingresa el número de solicitud que deseas consultar:', 'state': state}
-    elif msg in ('3', 'mis solicitudes', 'todas', 'listar', 'ver todas'):
+    elif msg in OPCIONES_LISTAR:
       limpiar_estado_preservando_correo(state)
       state['action'] = 'listar'
       state['next_action'] = True
@@ -253,9 +348,9 @@ def handle_message(state, message):
       if email_guardado_vigente(state):
         # Procesar inmediatamente con el correo guardado
         correo = state['correo_usuario']
-        conn = sqlite3.connect(DB)
+        conn = conectar()
         c = conn.cursor()
-        c.execute('SELECT * FROM solicitudes WHERE correo = ? ORDER BY id DESC', (correo,))
+        c.execute('SELECT * FROM solicitudes_todas WHERE correo = ? ORDER BY id DESC', (correo,))
         rows = c.fetchall()
         conn.close()
         
@@ -275,7 +370,7 @@ def handle_message(state, message):
           state['confirmado'] = True
           return {'reply': resultado, 'state': state, 'showButtons': True}
       return {'reply': 'Por favor ingresa tu correo electrónico para ver todas tus solicitudes:', 'state': state}
-    elif msg in ('cancelar', 'cancelar solicitud', 'anular'):
+    elif msg in OPCIONES_CANCELAR:
       limpiar_estado_preservando_correo(state)
       state['action'] = 'cancelar'
       state['next_action'] = True
@@ -285,14 +380,13 @@ def handle_message(state, message):
         # Buscar solicitudes pendientes
         conn = sqlite3.connect(DB)
         c = conn.cursor()
-        c.execute('SELECT id, tipo, inicio, fin FROM solicitudes WHERE correo = ? AND estado = "Pendiente"', (state['cancel_correo'],))
-        pendientes = c.fetchall()
+        pendientes = solicitudes_pendientes(c, state['cancel_correo'])
         conn.close()
         
         if pendientes:
           msg_pendientes = f'📋 **Solicitudes pendientes para {state["cancel_correo"]}:**\n\n'
           for p in pendientes:
-            msg_pendientes += f"#{p[0]} - {p[1]} ({p[2]} a {p[3]})\n"
+            msg_pendientes += f"#{p['id']} - {p['tipo']} ({p['inicio']} a {p['fin']})\n"
           msg_pendientes += '\n💡 Escribe el número de la solicitud que deseas cancelar:'
           return {'reply': msg_pendientes, 'state': state}
         else:
@@ -300,30 +394,24 @@ def handle_message(state, message):
           state['confirmado'] = True
           return {'reply': f'No se encontraron solicitudes pendientes para {state.get("correo_usuario")}.\n\n¿Qué deseas hacer?', 'state': state, 'showButtons': True}
       return {'reply': 'Para cancelar una solicitud, por favor ingresa tu correo electrónico:', 'state': state}
-    elif msg in ('4', 'salir', 'terminar', 'adios', 'chao'):
+    elif msg in OPCIONES_SALIR:
       state.clear()
       return {'reply': '¡Hasta pronto! Gracias por usar el sistema de solicitudes. Si necesitas algo más, solo escribe "hola" para comenzar.', 'state': state}
-    elif msg in ('estadisticas', 'estadísticas', 'stats', 'mis estadisticas'):
+    elif msg in OPCIONES_ESTADISTICAS:
       limpiar_estado_preservando_correo(state)
       state['action'] = 'estadisticas'
       state['next_action'] = True
       # Si hay correo guardado y vigente, procesar inmediatamente
       if email_guardado_vigente(state):
         correo = state['correo_usuario']
-        conn = sqlite3.connect(DB)
+        conn = conectar()
         c = conn.cursor()
         
-        c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ?', (correo,))
-        total = c.fetchone()[0]
-        c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Pendiente"', (correo,))
-        pendientes = c.fetchone()[0]
-        c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Aprobado"', (correo,))
-        aprobadas = c.fetchone()[0]
-        c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Rechazado"', (correo,))
-        rechazadas = c.fetchone()[0]
-        c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Cancelado"', (correo,))
-        canceladas = c.fetchone()[0]
-        c.execute('SELECT tipo, inicio, estado FROM solicitudes WHERE correo = ? ORDER BY id DESC LIMIT 1', (correo,))
+        conteos = estados.contar_por_estado(c, correo)
+        total = sum(conteos.values())
+        pendientes, aprobadas = conteos['Pendiente'], conteos['Aprobado']
+        rechazadas, canceladas = conteos['Rechazado'], conteos['Cancelado']
+        c.execute('SELECT tipo, inicio, estado FROM solicitudes_todas WHERE correo = ? ORDER BY id DESC LIMIT 1', (correo,))
         reciente = c.fetchone()
         conn.close()
         
@@ -360,27 +448,17 @@ def handle_message(state, message):
     else:
       return {'reply': 'Por favor ingresa un correo válido (debe contener @):', 'state': state}
     
-    conn = sqlite3.connect(DB)
+    conn = conectar()
     c = conn.cursor()
     
-    # Contar solicitudes por estado
-    c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ?', (correo,))
-    total = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Pendiente"', (correo,))
-    pendientes = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Aprobado"', (correo,))
-    aprobadas = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Rechazado"', (correo,))
-    rechazadas = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = "Cancelado"', (correo,))
-    canceladas = c.fetchone()[0]
+    # Contar solicitudes por estado (una sola consulta agrupada por el código entero)
+    conteos = estados.contar_por_estado(c, correo)
+    total = sum(conteos.values())
+    pendientes, aprobadas = conteos['Pendiente'], conteos['Aprobado']
+    rechazadas, canceladas = conteos['Rechazado'], conteos['Cancelado']
     
     # Solicitud más reciente
-    c.execute('SELECT tipo, inicio, estado FROM solicitudes WHERE correo = ? ORDER BY id DESC LIMIT 1', (correo,))
+    c.execute('SELECT tipo, inicio, estado FROM solicitudes_todas WHERE correo = ? ORDER BY id DESC LIMIT 1', (correo,))
     reciente = c.fetchone()
     
     conn.close()
@@ -416,9 +494,9 @@ def handle_message(state, message):
   if state.get('action') == 'consultar' and state.get('next_action'):
     try:
       solicitud_id = int(msg)
-      conn = sqlite3.connect(DB)
+      conn = conectar()
       c = conn.cursor()
-      c.execute('SELECT * FROM solicitudes WHERE id = ?', (solicitud_id,))
+      c.execute('SELECT * FROM solicitudes_todas WHERE id = ?', (solicitud_id,))
       row = c.fetchone()
       conn.close()
       
@@ -440,7 +518,7 @@ def handle_message(state, message):
         # Mostrar las solicitudes disponibles
         conn = sqlite3.connect(DB)
         c = conn.cursor()
-        c.execute('SELECT id, nombre, tipo, estado FROM solicitudes ORDER BY id DESC LIMIT 10')
+        c.execute('SELECT id, nombre, tipo, estado FROM solicitudes_v ORDER BY id DESC LIMIT 10')
         rows = c.fetchall()
         conn.close()
         
@@ -471,9 +549,9 @@ def handle_message(state, message):
     else:
       return {'reply': 'Por favor ingresa un correo válido (debe contener @):', 'state': state}
     
-    conn = sqlite3.connect(DB)
+    conn = conectar()
     c = conn.cursor()
-    c.execute('SELECT * FROM solicitudes WHERE correo = ? ORDER BY id DESC', (correo,))
+    c.execute('SELECT * FROM solicitudes_todas WHERE correo = ? ORDER BY id DESC', (correo,))
     rows = c.fetchall()
     conn.close()
     
@@ -513,14 +591,13 @@ def handle_message(state, message):
       # Buscar solicitudes pendientes del usuario
       conn = sqlite3.connect(DB)
       c = conn.cursor()
-      c.execute('SELECT id, tipo, inicio, fin FROM solicitudes WHERE correo = ? AND estado = "Pendiente" ORDER BY id DESC', (correo,))
-      rows = c.fetchall()
+      rows = solicitudes_pendientes(c, correo)
       conn.close()
       
       if rows:
         resultado = f"📋 **Solicitudes pendientes para {correo}:**\n\n"
         for row in rows:
-          resultado += f"#{row[0]} - {row[1]} ({row[2]} al {row[3]})\n"
+          resultado += f"#{row['id']} - {row['tipo']} ({row['inicio']} al {row['fin']})\n"
         resultado += f"\n💡 Escribe el número de la solicitud que deseas cancelar:"
         return {'reply': resultado, 'state': state}
       else:
@@ -532,14 +609,16 @@ def handle_message(state, message):
       try:
         solicitud_id = int(msg)
         conn = sqlite3.connect(DB)
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
-        c.execute('SELECT * FROM solicitudes WHERE id = ? AND correo = ? AND estado = "Pendiente"', (solicitud_id, state['cancel_correo']))
-        row = c.fetchone()
+        # Un solo UPDATE condicionado: si un admin la decidió antes, no se cancela
+        row = estados.transicionar(c, solicitud_id, 'Cancelado', correo=state['cancel_correo'])
         
         if row:
-          c.execute('UPDATE solicitudes SET estado = ? WHERE id = ?', ('Cancelado', solicitud_id))
+          analitica.registrar_transicion(c, row['tipo'], row['creado_en'], 'Pendiente', 'Cancelado')
           conn.commit()
           conn.close()
+          instantanea_lectura.registrar_escritura()
           
           # Enviar notificación
           subject = f"❌ Solicitud #{solicitud_id} - Cancelada"
@@ -645,13 +724,18 @@ Sistema de Gestión de Permisos"""
       # save to DB
       conn = sqlite3.connect(DB)
       c = conn.cursor()
-      c.execute('''INSERT INTO solicitudes (nombre, correo, tipo, inicio, fin, motivo, estado, creado_en)
+      creado_en = datetime.now().isoformat()
+      tipo_id, tipo = esquema.tipo_id(c, state['tipo'])
+      c.execute('''INSERT INTO solicitudes (nombre, correo, tipo_id, inicio, fin, motivo, estado, creado_en)
       VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (
-        state['nombre'], state['correo'], state['tipo'], state['inicio'], state['fin'], state['motivo'], 'Pendiente', datetime.now().isoformat()
+        state['nombre'], state['correo'], tipo_id, esquema.codificar_fecha(state['inicio']), esquema.codificar_fecha(state['fin']),
+        state['motivo'], esquema.codificar_estado('Pendiente'), esquema.codificar_instante(creado_en)
       ))
+      analitica.registrar_alta(c, tipo, creado_en)
       conn.commit()
       solicitud_id = c.lastrowid
       conn.close()
+      instantanea_lectura.registrar_escritura()
       state['solicitud_id'] = solicitud_id
       state['solicitud_guardada'] = True  # Marcar que ya se guardó
       state['esperando_confirmacion'] = False  # Ya no está esperando la primera confirmación
@@ -668,7 +752,7 @@ Sistema de Gestión de Permisos"""
       conn = sqlite3.connect(DB)
       conn.row_factory = sqlite3.Row
       c = conn.cursor()
-      c.execute('SELECT * FROM solicitudes WHERE id = ?', (state['solicitud_id'],))
+      c.execute('SELECT * FROM solicitudes_v WHERE id = ?', (state['solicitud_id'],))
       row = c.fetchone()
       conn.close()
       
@@ -719,13 +803,20 @@ Sistema de Gestión de Permisos"""
 
 # --- Flask routes ---
 
+@app.before_request
+def _antes_de_peticion():
+    asegurar_db()
+
+
 @app.route('/')
 def index():
     return send_file('index.html')
 
 
 @app.route('/chat', methods=['POST'])
+@perfilador.perfilable
 def chat():
+    inicio = time.perf_counter()
     data = request.json
     session_id = data.get('session_id', 'default')
     message = data.get('message', '').strip()
@@ -733,16 +824,24 @@ def chat():
     # Handle reset
     if message.lower() in ('reiniciar', 'reset', 'empezar', 'hola', 'inicio', 'menu'):
         sessions[session_id] = {}
-        return jsonify({'reply': '¡Hola! 👋 Bienvenido al sistema de solicitudes de permisos.\n\n¿Qué deseas hacer?\n\n💡 Tip: Puedes usar los botones o escribir directamente tu nombre para crear una solicitud.'})
+        reply = '¡Hola! 👋 Bienvenido al sistema de solicitudes de permisos.\n\n¿Qué deseas hacer?\n\n💡 Tip: Puedes usar los botones o escribir directamente tu nombre para crear una solicitud.'
+        registro_conversaciones.registrar(session_id, 'reinicio', message, reply,
+                                          (time.perf_counter() - inicio) * 1000)
+        return jsonify({'reply': reply})
 
     # Get or create session state
     if session_id not in sessions:
         sessions[session_id] = {}
 
     state = sessions[session_id]
+    paso = paso_conversacion(state, message)
+    g.paso_perfil = paso
     result = handle_message(state, message)
     sessions[session_id] = result['state']
 
+    # Solo encola el evento; el escritor en segundo plano hace el INSERT
+    registro_conversaciones.registrar(session_id, paso, message, result['reply'],
+                                      (time.perf_counter() - inicio) * 1000)
     return jsonify({'reply': result['reply']})
 
 
@@ -753,93 +852,73 @@ def admin():
 
 @app.route('/api/solicitudes', methods=['GET'])
 def get_solicitudes():
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
+    # ?archivo=0 limita la consulta a la base caliente (sin solicitudes archivadas)
+    tabla = 'main.solicitudes' if request.args.get('archivo') == '0' else 'solicitudes_todas_fisicas'
+    conn = conectar_lectura()
     c = conn.cursor()
-    c.execute('SELECT * FROM solicitudes ORDER BY id DESC')
-    rows = c.fetchall()
+    # Se leen las columnas enteras y se decodifican en Python (sin la vista de texto)
+    c.execute(f'SELECT {esquema.LISTA_FISICAS} FROM {tabla} ORDER BY id DESC')
+    solicitudes = esquema.decodificar_filas(c, c.fetchall())
     conn.close()
     
-    solicitudes = [dict(row) for row in rows]
     return jsonify(solicitudes)
 
 
 @app.route('/api/solicitudes/<int:solicitud_id>', methods=['PUT'])
+@perfilador.perfilable
 def update_solicitud(solicitud_id):
     data = request.json
     nuevo_estado = data.get('estado')
+    g.paso_perfil = nuevo_estado
     
-    if nuevo_estado not in ['Pendiente', 'Aprobado', 'Rechazado']:
+    if nuevo_estado not in ['Aprobado', 'Rechazado']:
         return jsonify({'error': 'Estado inválido'}), 400
     
-    # Obtener datos de la solicitud antes de actualizar
+    # Transición en un único UPDATE condicionado al estado (y a la versión, si se envía)
     conn = sqlite3.connect(DB)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute('SELECT * FROM solicitudes WHERE id = ?', (solicitud_id,))
-    row = c.fetchone()
+    row = estados.transicionar(c, solicitud_id, nuevo_estado, version=data.get('version'))
     
     if not row:
+        conn.rollback()
         conn.close()
-        return jsonify({'error': 'Solicitud no encontrada'}), 404
+        # Distinguir inexistente de conflicto (solo en el camino de error)
+        conn = conectar()
+        conn.row_factory = sqlite3.Row
+        actual = conn.execute('SELECT estado, version FROM solicitudes_todas WHERE id = ?', (solicitud_id,)).fetchone()
+        conn.close()
+        if not actual:
+            return jsonify({'error': 'Solicitud no encontrada'}), 404
+        return jsonify({
+            'error': f"La solicitud {solicitud_id} ya no está pendiente o fue modificada por otra persona",
+            'estado': actual['estado'],
+            'version': actual['version'],
+        }), 409
     
     solicitud = dict(row)
-    
-    # Actualizar estado
-    c.execute('UPDATE solicitudes SET estado = ? WHERE id = ?', (nuevo_estado, solicitud_id))
+    analitica.registrar_transicion(c, solicitud['tipo'], solicitud['creado_en'], estados.ESTADO_INICIAL, nuevo_estado)
     conn.commit()
     conn.close()
+    instantanea_lectura.registrar_escritura()
     
-    # Enviar notificación por correo
-    if nuevo_estado in ['Aprobado', 'Rechazado']:
-        estado_emoji = "✅" if nuevo_estado == "Aprobado" else "❌"
-        subject = f"{estado_emoji} Solicitud de Permiso #{solicitud_id} - {nuevo_estado}"
-        
-        if nuevo_estado == 'Aprobado':
-            body = f"""Hola {solicitud['nombre']},
-
-¡Buenas noticias! Tu solicitud de permiso ha sido APROBADA.
-
-Detalles de tu solicitud:
-- Número de solicitud: #{solicitud['id']}
-- Tipo de permiso: {solicitud['tipo']}
-- Fecha inicio: {solicitud['inicio']}
-- Fecha fin: {solicitud['fin']}
-- Motivo: {solicitud['motivo']}
-
-Tu permiso ha sido autorizado. Puedes proceder con tus planes.
-
-Saludos,
-Departamento de Recursos Humanos"""
-        else:
-            body = f"""Hola {solicitud['nombre']},
-
-Lamentamos informarte que tu solicitud de permiso ha sido RECHAZADA.
-
-Detalles de tu solicitud:
-- Número de solicitud: #{solicitud['id']}
-- Tipo de permiso: {solicitud['tipo']}
-- Fecha inicio: {solicitud['inicio']}
-- Fecha fin: {solicitud['fin']}
-- Motivo: {solicitud['motivo']}
-
-Si tienes preguntas sobre esta decisión, por favor contacta al Departamento de Recursos Humanos.
-
-Saludos,
-Departamento de Recursos Humanos"""
-        
-        send_email_notification(solicitud['correo'], subject, body)
+    # Notificar por correo (agrupado por destinatario durante NOTIFICACION_VENTANA_SEG)
+    urgente = esquema.clave_tipo(solicitud['tipo']) in NOTIFICACION_TIPOS_URGENTES
+    agrupador_notificaciones.encolar(solicitud['correo'], solicitud_id, solicitud, urgente=urgente)
     
-    return jsonify({'success': True, 'message': f'Solicitud {solicitud_id} actualizada a {nuevo_estado}'})
+    return jsonify({'success': True, 'message': f'Solicitud {solicitud_id} actualizada a {nuevo_estado}',
+                    'version': solicitud['version']})
 
 
 @app.route('/api/solicitudes/<int:solicitud_id>/pdf', methods=['GET'])
+@perfilador.perfilable
 def download_pdf(solicitud_id):
     """Endpoint para descargar el PDF de una solicitud"""
-    conn = sqlite3.connect(DB)
+    g.paso_perfil = 'descarga_pdf'
+    conn = conectar()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute('SELECT * FROM solicitudes WHERE id = ?', (solicitud_id,))
+    c.execute('SELECT * FROM solicitudes_todas WHERE id = ?', (solicitud_id,))
     row = c.fetchone()
     conn.close()
     
@@ -852,5 +931,97 @@ def download_pdf(solicitud_id):
     return send_file(pdf_file, as_attachment=True, download_name=f'solicitud_{solicitud_id}.pdf')
 
 
+@app.route('/api/analitica', methods=['GET'])
+def get_analitica():
+    """Tasa de aprobación por tipo, volumen por periodo y tiempo medio de decisión."""
+    granularidad = request.args.get('granularidad', 'mes')
+    if granularidad not in ('dia', 'mes'):
+        return jsonify({'error': 'Granularidad inválida (dia o mes)'}), 400
+    conn = conectar_lectura()
+    resultado = analitica.consultar(conn, granularidad, request.args.get('desde'),
+                                    request.args.get('hasta'), request.args.get('tipo'))
+    conn.close()
+    return jsonify(resultado)
+
+
+@app.route('/api/instantanea', methods=['GET'])
+def get_instantanea():
+    """Antigüedad y coste de refresco de la instantánea de lectura (?refrescar=1 fuerza uno)."""
+    if request.args.get('refrescar') == '1':
+        instantanea_lectura.refrescar()
+    return jsonify(instantanea_lectura.metricas())
+
+
+@app.route('/api/auditoria', methods=['GET'])
+def get_auditoria():
+    """Eventos escritos, descartados y errores de escritura del registro de conversaciones."""
+    return jsonify(registro_conversaciones.metricas())
+
+
+@app.route('/api/perfiles', methods=['GET'])
+def listar_perfiles():
+    """Lista los perfiles guardados (ruta, paso, duración)."""
+    return jsonify(perfilador.listar())
+
+
+@app.route('/api/perfiles/<perfil_id>', methods=['GET'])
+def descargar_perfil(perfil_id):
+    """Descarga un perfil en formato pstats, o su resumen con ?formato=texto"""
+    ruta = perfilador.ruta_perfil(perfil_id)
+    if not ruta:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    if request.args.get('formato') == 'texto':
+        return perfilador.resumen(perfil_id), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return send_file(os.path.abspath(ruta), as_attachment=True, download_name=f'{perfil_id}.prof')
+
+
+# --- Mantenimiento ---
+
+@app.cli.command('mantenimiento')
+@click.option('--dias', default=ARCHIVO_DIAS, show_default=True, help='Antigüedad mínima para archivar.')
+@click.option('--lote', default=ARCHIVO_LOTE, show_default=True, help='Filas por transacción.')
+def mantenimiento(dias, lote):
+    """Archiva solicitudes cerradas antiguas y compacta la base caliente."""
+    asegurar_db()
+    conn = conectar()
+    movidas = archivo.archivar(conn, dias, lote)
+    libres = archivo.vacuum_incremental(conn)
+    conn.close()
+    click.echo(f'{movidas} solicitudes archivadas en {ARCHIVO_DB}; {libres} páginas libres compactadas.')
+
+
+@app.cli.command('reconstruir-analitica')
+def reconstruir_analitica():
+    """Recalcula los agregados de analítica desde las solicitudes (incluye el archivo)."""
+    asegurar_db()
+    conn = conectar()
+    total = analitica.reconstruir(conn, 'solicitudes_todas_fisicas')
+    conn.close()
+    click.echo(f'Analítica reconstruida: {total} solicitudes agregadas.')
+
+
+@app.cli.command('auditoria')
+@click.option('--sesion', default=None, help='Filtrar por session_id.')
+@click.option('--desde', default=None, help='Fecha/hora ISO inicial (incluida).')
+@click.option('--hasta', default=None, help='Fecha/hora ISO final (excluida).')
+@click.option('--limite', default=None, type=int)
+@click.option('--formato', type=click.Choice(['texto', 'jsonl', 'csv']), default='texto', show_default=True)
+def exportar_auditoria(sesion, desde, hasta, limite, formato):
+    """Consulta o exporta el registro de conversaciones del chat."""
+    eventos = auditoria.consultar(AUDITORIA_DB, sesion, desde, hasta, limite)
+    if formato == 'jsonl':
+        for evento in eventos:
+            click.echo(json.dumps(evento, ensure_ascii=False))
+    elif formato == 'csv':
+        escritor = csv.DictWriter(sys.stdout, fieldnames=auditoria.COLUMNAS)
+        escritor.writeheader()
+        escritor.writerows(eventos)
+    else:
+        for e in eventos:
+            click.echo(f"{e['creado_en']} [{e['session_id']}] {e['paso']} ({e['latencia_ms']:.1f} ms)\n"
+                       f"  > {e['mensaje']}\n  < {e['respuesta']}")
+
+
 if __name__ == '__main__':
+    asegurar_db()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Archivo frío de solicitudes cerradas.
+
+Las solicitudes Aprobadas, Rechazadas o Canceladas con más de cierta
+antigüedad se mueven de `solicitudes.db` (base caliente) a una base de
+datos aparte que se adjunta a cada conexión con el alias `archivo`.
+La vista temporal `solicitudes_todas` une ambas tablas para que las
+consultas por id o correo lean del archivo de forma transparente;
+`solicitudes_todas_fisicas` hace lo mismo con las columnas enteras, para
+filtrar y agrupar sin decodificar.
+"""
+from datetime import datetime, timedelta
+
+import esquema
+
+# Estados que se consideran cerrados y por tanto archivables
+ESTADOS_CERRADOS = ('Aprobado', 'Rechazado', 'Cancelado')
+
+_LISTA_FISICAS = esquema.LISTA_FISICAS
+
+
+def crear_tabla_archivo(conn):
+    """
+    Crea la tabla de archivo (sin AUTOINCREMENT: conserva los ids originales).
+    Se llama una vez desde init_db, con el archivo ya adjunto. Devuelve las filas
+    migradas si el archivo aún tenía el esquema de texto.
+    """
+    migradas = esquema.migrar(conn, 'archivo')
+    conn.execute(esquema.sql_crear_tabla('archivo.solicitudes', autoincrement=False, extra=('archivado_en',)))
+    conn.execute('CREATE INDEX IF NOT EXISTS archivo.idx_archivo_correo ON solicitudes (correo)')
+    return migradas
+
+
+def crear_vista_todas(conn, sin_duplicados=False):
+    """
+    Vistas TEMP con las solicitudes calientes y archivadas: `solicitudes_todas` en
+    formato de texto y `solicitudes_todas_fisicas` con las columnas enteras.
+    Con `sin_duplicados` se omiten del archivo los ids que siguen en main (para
+    una copia de main anterior al último archivado).
+    """
+    filtro = ' WHERE s.id NOT IN (SELECT id FROM main.solicitudes)' if sin_duplicados else ''
+    conn.execute(f'''
+      CREATE TEMP VIEW IF NOT EXISTS solicitudes_todas_fisicas AS
+      SELECT {_LISTA_FISICAS} FROM main.solicitudes
+      UNION ALL
+      SELECT {_LISTA_FISICAS} FROM archivo.solicitudes s{filtro}
+    ''')
+    conn.execute(f'''
+      CREATE TEMP VIEW IF NOT EXISTS solicitudes_todas AS
+      SELECT {esquema.sql_columnas_legibles()}
+      FROM main.solicitudes s LEFT JOIN main.tipos t ON t.id = s.tipo_id
+      UNION ALL
+      SELECT {esquema.sql_columnas_legibles()}
+      FROM archivo.solicitudes s LEFT JOIN main.tipos t ON t.id = s.tipo_id{filtro}
+    ''')
+
+
+def adjuntar(conn, archivo_db):
+    """
+    Adjunta la base de archivo a `conn` y crea la vista `solicitudes_todas`.
+    La vista es TEMP porque referencia una base adjunta. La tabla del archivo
+    ya existe (la crea init_db), así que aquí no se ejecuta DDL persistente.
+    """
+    conn.execute('ATTACH DATABASE ? AS archivo', (archivo_db,))
+    crear_vista_todas(conn)
+    return conn
+
+
+def archivar(conn, dias, lote=500):
+    """
+    Mueve al archivo las solicitudes cerradas creadas hace más de `dias` días.
+    Trabaja en lotes de `lote` filas, cada uno en su propia transacción, para no
+    bloquear la base caliente durante mucho tiempo. Devuelve el total movido.
+    """
+    limite = esquema.codificar_instante((datetime.now() - timedelta(days=dias)).isoformat())
+    codigos = [esquema.codificar_estado(e) for e in ESTADOS_CERRADOS]
+    marcadores = ', '.join('?' for _ in ESTADOS_CERRADOS)
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ids = [r[0] for r in conn.execute(
+                f'SELECT id FROM main.solicitudes WHERE estado IN ({marcadores}) '
+                'AND creado_en < ? ORDER BY id LIMIT ?',
+                (*codigos, limite, lote))]
+            if not ids:
+                conn.rollback()
+                break
+            ids_marcadores = ', '.join('?' for _ in ids)
+            conn.execute(
+                f'INSERT OR REPLACE INTO archivo.solicitudes ({_LISTA_FISICAS}, archivado_en) '
+                f'SELECT {_LISTA_FISICAS}, ? FROM main.solicitudes WHERE id IN ({ids_marcadores})',
+                (datetime.now().isoformat(), *ids))
+            conn.execute(f'DELETE FROM main.solicitudes WHERE id IN ({ids_marcadores})', ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += len(ids)
+        if len(ids) < lote:
+            break
+    return total
+
+
+def vacuum_incremental(conn):
+    """
+    Libera las páginas vacías de la base caliente. Si la base aún no usa
+    auto_vacuum incremental se activa y se hace un VACUUM completo una única vez.
+    Devuelve el número de páginas libres antes de compactar.
+    """
+    libres = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM main')
+    else:
+        conn.execute('PRAGMA main.incremental_vacuum').fetchall()
+    return libres
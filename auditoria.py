@@ -0,0 +1,183 @@
+"""
+Registro de auditoría de las conversaciones del chat.
+
+Cada mensaje de /chat genera un evento (session_id, paso, mensaje, respuesta,
+latencia). `registrar()` solo lo encola en un buffer acotado en memoria; un hilo
+en segundo plano los escribe por lotes (group commit) en una base SQLite aparte,
+de modo que el camino de /chat nunca espera a un INSERT. Al terminar el proceso
+se vacía el buffer pendiente.
+
+Si un lote no se puede escribir (base bloqueada, disco lleno...) se registra el
+error y se reintenta el mismo lote; el hilo no muere. `metricas()` expone los
+eventos escritos, descartados y los errores de escritura.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS = ('id', 'creado_en', 'session_id', 'paso', 'mensaje', 'respuesta', 'latencia_ms')
+
+
+def crear_tabla(conn):
+    conn.execute('''
+      CREATE TABLE IF NOT EXISTS eventos (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      creado_en TEXT,
+      session_id TEXT,
+      paso TEXT,
+      mensaje TEXT,
+      respuesta TEXT,
+      latencia_ms REAL
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_eventos_sesion ON eventos (session_id, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_eventos_fecha ON eventos (creado_en)')
+
+
+class RegistroConversaciones:
+    """
+    Escritor en segundo plano con group commit.
+
+    - `capacidad`: máximo de eventos en memoria; si se llena, los nuevos se
+      descartan (y se cuentan) en lugar de bloquear la petición.
+    - `lote`: máximo de eventos por transacción.
+    - `intervalo`: segundos que el escritor espera a que se acumulen eventos, y
+      entre reintentos de un lote fallido.
+    """
+
+    def __init__(self, db_path, capacidad=10000, lote=500, intervalo=1.0):
+        self.db_path = db_path
+        self.lote = lote
+        self.intervalo = intervalo
+        self.descartados = 0
+        self.escritos = 0
+        self.errores = 0
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._detener = threading.Event()
+        self._hilo = None
+        self._candado = threading.Lock()
+
+    def registrar(self, session_id, paso, mensaje, respuesta, latencia_ms):
+        """Encola un evento sin bloquear. Arranca el escritor la primera vez."""
+        if self._hilo is None:
+            self._iniciar()
+        evento = (datetime.now().isoformat(), session_id, paso, mensaje, respuesta, latencia_ms)
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            self.descartados += 1
+
+    def _iniciar(self):
+        with self._candado:
+            if self._hilo is not None:
+                return
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('PRAGMA journal_mode = WAL')
+            crear_tabla(conn)
+            conn.commit()
+            conn.close()
+            self._hilo = threading.Thread(target=self._bucle, name='auditoria', daemon=True)
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    def _bucle(self):
+        conn = sqlite3.connect(self.db_path)
+        lote = []  # eventos aún no escritos (incluye un lote fallido que se reintenta)
+        try:
+            while not self._detener.is_set():
+                if not lote:
+                    try:
+                        primero = self._cola.get(timeout=self.intervalo)
+                    except queue.Empty:
+                        continue
+                    # Dar tiempo a que lleguen más eventos y escribirlos juntos
+                    self._detener.wait(min(self.intervalo, 0.05))
+                    lote = [primero] + self._tomar(self.lote - 1)
+                if self._escribir(conn, lote):
+                    lote = []
+                else:
+                    self._detener.wait(self.intervalo)
+            # Vaciar lo que quede al detener (un único intento por lote)
+            while True:
+                lote = lote or self._tomar(self.lote)
+                if not lote:
+                    break
+                if not self._escribir(conn, lote):
+                    self.descartados += len(lote) + self._cola.qsize()
+                    logger.error('Auditoría: se pierden %d eventos al detener el escritor',
+                                 len(lote) + self._cola.qsize())
+                    break
+                lote = []
+        finally:
+            conn.close()
+
+    def _tomar(self, maximo):
+        eventos = []
+        while len(eventos) < maximo:
+            try:
+                eventos.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return eventos
+
+    def _escribir(self, conn, eventos):
+        """Escribe un lote en una transacción. Devuelve False (y lo registra) si falla."""
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT INTO eventos (creado_en, session_id, paso, mensaje, respuesta, latencia_ms) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', eventos)
+        except sqlite3.Error:
+            self.errores += 1
+            logger.exception('Auditoría: no se pudo escribir un lote de %d eventos; se reintentará',
+                             len(eventos))
+            return False
+        self.escritos += len(eventos)
+        return True
+
+    def metricas(self):
+        return {
+            'escritos': self.escritos,
+            'descartados': self.descartados,
+            'errores_escritura': self.errores,
+            'en_cola': self._cola.qsize(),
+            'escritor_activo': self._hilo is not None and self._hilo.is_alive(),
+        }
+
+    def detener(self, timeout=5.0):
+        """Detiene el escritor tras escribir los eventos pendientes."""
+        if self._hilo is None:
+            return
+        self._detener.set()
+        self._hilo.join(timeout)
+
+
+def consultar(db_path, session_id=None, desde=None, hasta=None, limite=None):
+    """Devuelve los eventos (dicts) que cumplen los filtros, en orden cronológico."""
+    condiciones, params = [], []
+    if session_id:
+        condiciones.append('session_id = ?')
+        params.append(session_id)
+    if desde:
+        condiciones.append('creado_en >= ?')
+        params.append(desde)
+    if hasta:
+        condiciones.append('creado_en < ?')
+        params.append(hasta)
+    sql = f'SELECT {", ".join(COLUMNAS)} FROM eventos'
+    if condiciones:
+        sql += ' WHERE ' + ' AND '.join(condiciones)
+    sql += ' ORDER BY id'
+    if limite:
+        sql += ' LIMIT ?'
+        params.append(limite)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    crear_tabla(conn)
+    filas = [dict(r) for r in conn.execute(sql, params)]
+    conn.close()
+    return filas
@@ -0,0 +1,66 @@
+"""
+Benchmark de arranque en frío.
+
+Mide, en procesos nuevos (como un worker recién creado):
+  - importación: tiempo de `import app`
+  - primera respuesta: importación + primer POST /chat que toca la base
+y cuenta si reportlab / smtplib quedaron cargados tras la primera respuesta.
+
+Uso:
+    python benchmarks/arranque.py [--repeticiones N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HIJO = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter() - t0
+cliente = app.app.test_client()
+cliente.post('/chat', json={'session_id': 'bench', 'message': '2'})
+t_respuesta = time.perf_counter() - t0
+print(json.dumps({
+    'importacion': t_import,
+    'primera_respuesta': t_respuesta,
+    'reportlab': 'reportlab' in sys.modules,
+    'smtplib': 'smtplib' in sys.modules,
+}))
+'''
+
+
+def medir(repeticiones):
+    resultados = []
+    entorno = dict(os.environ, PYTHONPATH=RAIZ)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cada proceso arranca en un directorio vacío: la base se crea en la primera petición
+        for _ in range(repeticiones):
+            salida = subprocess.run([sys.executable, '-c', HIJO], cwd=tmp, env=entorno,
+                                    capture_output=True, text=True, check=True)
+            resultados.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    args = parser.parse_args()
+
+    resultados = medir(args.repeticiones)
+    for clave in ('importacion', 'primera_respuesta'):
+        valores = [r[clave] * 1000 for r in resultados]
+        print(f"{clave:<18} mediana {statistics.median(valores):7.1f} ms   "
+              f"mín {min(valores):7.1f} ms   máx {max(valores):7.1f} ms")
+    print(f"reportlab cargado tras /chat: {resultados[-1]['reportlab']}")
+    print(f"smtplib cargado tras /chat:   {resultados[-1]['smtplib']}")
+
+
+if __name__ == '__main__':
+    main()
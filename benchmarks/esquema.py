@@ -0,0 +1,185 @@
+"""
+Benchmark del esquema compacto frente al esquema de texto.
+
+Genera N solicitudes sintéticas con el esquema de texto anterior, copia la base y
+la migra con `esquema.migrar`, y compara tamaño en disco y tiempos de las consultas
+que hace la aplicación. En el esquema compacto los filtros y agrupaciones van sobre
+las columnas enteras y solo se decodifica el resultado; las lecturas acotadas (por
+número, últimas 10) siguen yendo por la vista `solicitudes_v`. Mismos índices en
+ambas: correo y estado+creado_en.
+
+Uso:
+    python benchmarks/esquema.py [--filas N] [--repeticiones R]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import analitica  # noqa: E402
+import esquema  # noqa: E402
+import estados  # noqa: E402
+
+TIPOS = ['Enfermedad', 'enfermedad', 'Personal', 'Estudio', 'Vacaciones', 'vacaciones',
+         'Vacaciones ', 'Familiar', 'Calamidad Domestica', 'Cita Medica']
+ESTADOS = ['Pendiente', 'Aprobado', 'Aprobado', 'Rechazado', 'Cancelado']
+
+
+def crear_base_texto(ruta, filas):
+    conn = sqlite3.connect(ruta)
+    conn.execute('''
+      CREATE TABLE solicitudes (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      nombre TEXT, correo TEXT, tipo TEXT, inicio TEXT, fin TEXT, motivo TEXT,
+      estado TEXT, creado_en TEXT, comentarios TEXT, version INTEGER NOT NULL DEFAULT 0
+    )''')
+    azar = random.Random(42)
+    base = datetime(2023, 1, 1)
+    datos = []
+    for i in range(filas):
+        creado = base + timedelta(seconds=azar.randrange(3 * 365 * 86400), microseconds=azar.randrange(1000000))
+        inicio = creado.date() + timedelta(days=azar.randrange(1, 60))
+        fin = inicio + timedelta(days=azar.randrange(0, 15))
+        datos.append((f'Empleado {i % 5000}', f'empleado{i % 5000}@empresa.com', azar.choice(TIPOS),
+                      inicio.isoformat(), fin.isoformat(), 'Motivo de prueba', azar.choice(ESTADOS),
+                      creado.isoformat()))
+    conn.executemany('INSERT INTO solicitudes (nombre, correo, tipo, inicio, fin, motivo, estado, creado_en) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', datos)
+    conn.commit()
+    conn.close()
+
+
+def crear_indices(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_solicitudes_correo ON solicitudes (correo)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_solicitudes_estado ON solicitudes (estado, creado_en)')
+    conn.commit()
+    conn.execute('VACUUM')
+
+
+CORREO = 'empleado42@empresa.com'
+CERRADAS = ('Aprobado', 'Rechazado', 'Cancelado')
+
+
+def _filas(conn, sql, params=()):
+    return conn.execute(sql, params).fetchall()
+
+
+def _listado_texto(conn):
+    return [dict(r) for r in _filas(conn, 'SELECT * FROM solicitudes ORDER BY id DESC')]
+
+
+def _listado_compacta(conn):
+    c = conn.cursor()
+    return esquema.decodificar_filas(c, _filas(c, f'SELECT {esquema.LISTA_FISICAS} FROM solicitudes ORDER BY id DESC'))
+
+
+def _pendientes_compacta(conn):
+    c = conn.cursor()
+    return esquema.decodificar_filas(c, _filas(
+        c, f'SELECT {esquema.LISTA_FISICAS} FROM solicitudes WHERE correo = ? AND estado = ? ORDER BY id DESC',
+        (CORREO, esquema.codificar_estado('Pendiente'))))
+
+
+def _estadisticas_texto(conn):
+    return [_filas(conn, 'SELECT COUNT(*) FROM solicitudes WHERE correo = ?', (CORREO,))] + [
+        _filas(conn, 'SELECT COUNT(*) FROM solicitudes WHERE correo = ? AND estado = ?', (CORREO, e))
+        for e in esquema.ESTADOS]
+
+
+def _analitica_texto(conn):
+    return [_filas(conn, f'SELECT substr(creado_en, 1, {longitud}), tipo, estado, COUNT(*) FROM solicitudes '
+                         'WHERE creado_en IS NOT NULL GROUP BY 1, 2, 3')
+            for longitud in (10, 7)]
+
+
+# Cada consulta de la aplicación: (esquema de texto, como antes de la migración;
+# esquema compacto, filtrando y agrupando por las columnas enteras y decodificando
+# solo el resultado en Python)
+CONSULTAS = {
+    'admin: listado completo': (_listado_texto, _listado_compacta),
+    'chat: últimas 10': (
+        lambda conn: _filas(conn, 'SELECT id, nombre, tipo, estado FROM solicitudes ORDER BY id DESC LIMIT 10'),
+        lambda conn: _filas(conn, 'SELECT id, nombre, tipo, estado FROM solicitudes_v ORDER BY id DESC LIMIT 10')),
+    'chat: por número': (
+        lambda conn: _filas(conn, 'SELECT * FROM solicitudes WHERE id = 4242'),
+        lambda conn: _filas(conn, 'SELECT * FROM solicitudes_v WHERE id = 4242')),
+    'chat: pendientes por correo': (
+        lambda conn: _filas(conn, 'SELECT id, tipo, inicio, fin FROM solicitudes WHERE correo = ? AND estado = ? '
+                                  'ORDER BY id DESC', (CORREO, 'Pendiente')),
+        _pendientes_compacta),
+    'chat: estadísticas por correo': (
+        _estadisticas_texto,
+        lambda conn: estados.contar_por_estado(conn, CORREO, 'solicitudes')),
+    'analítica: reconstruir': (
+        _analitica_texto,
+        lambda conn: analitica.contar_estados(conn, 'solicitudes')),
+    'archivar: cerradas antiguas': (
+        lambda conn: _filas(conn, f"SELECT id FROM solicitudes WHERE estado IN ({', '.join('?' * 3)}) "
+                                  "AND creado_en < ? ORDER BY id LIMIT 500", (*CERRADAS, '2024-01-01')),
+        lambda conn: _filas(conn, f"SELECT id FROM solicitudes WHERE estado IN ({', '.join('?' * 3)}) "
+                                  "AND creado_en < ? ORDER BY id LIMIT 500",
+                            (*map(esquema.codificar_estado, CERRADAS),
+                             esquema.codificar_instante('2024-01-01T00:00:00')))),
+}
+
+
+def medir(conn, consulta, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        consulta(conn)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=200000)
+    parser.add_argument('--repeticiones', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        texto = os.path.join(tmp, 'texto.db')
+        compacta = os.path.join(tmp, 'compacta.db')
+        crear_base_texto(texto, args.filas)
+        shutil.copy(texto, compacta)
+
+        # Como en app.py: el listado de texto hacía dict(sqlite3.Row); el compacto decodifica tuplas
+        conn_texto = sqlite3.connect(texto)
+        conn_texto.row_factory = sqlite3.Row
+        crear_indices(conn_texto)
+
+        conn_compacta = sqlite3.connect(compacta)
+        inicio = time.perf_counter()
+        esquema.migrar(conn_compacta)
+        migracion_s = time.perf_counter() - inicio
+        esquema.crear_vista(conn_compacta)
+        crear_indices(conn_compacta)
+
+        tam_texto = os.path.getsize(texto)
+        tam_compacta = os.path.getsize(compacta)
+        tipos = conn_compacta.execute('SELECT COUNT(*) FROM tipos').fetchone()[0]
+        print(f'{args.filas} filas, {len(set(TIPOS))} variantes de tipo -> {tipos} tipos tras normalizar')
+        print(f'migración: {migracion_s:.2f} s')
+        print(f'tamaño: texto {tam_texto / 1024:.0f} KiB, compacta {tam_compacta / 1024:.0f} KiB '
+              f'({(1 - tam_compacta / tam_texto) * 100:.1f}% menos)')
+        print()
+        print(f"{'consulta':<32} {'texto ms':>10} {'compacta ms':>12}")
+        for nombre, (texto_fn, compacta_fn) in CONSULTAS.items():
+            print(f'{nombre:<32} {medir(conn_texto, texto_fn, args.repeticiones):>10.2f} '
+                  f'{medir(conn_compacta, compacta_fn, args.repeticiones):>12.2f}')
+        conn_texto.close()
+        conn_compacta.close()
+
+
+if __name__ == '__main__':
+    main()
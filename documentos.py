@@ -0,0 +1,81 @@
+"""
+Generación del comprobante PDF de una solicitud.
+
+Se importa de forma diferida desde app.py: reportlab solo se carga cuando
+se genera el primer PDF.
+"""
+import os
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.units import inch
+
+
+def generate_pdf(solicitud_data):
+    """Genera un PDF con los detalles de la solicitud"""
+    if not os.path.exists('pdfs'):
+        os.makedirs('pdfs')
+    
+    filename = f"pdfs/solicitud_{solicitud_data['id']}.pdf"
+    doc = SimpleDocTemplate(filename, pagesize=letter)
+    elements = []
+    
+    # Estilos
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#667eea'),
+        spaceAfter=30,
+        alignment=1
+    )
+    
+    # Título
+    title = Paragraph("📋 SOLICITUD DE PERMISO", title_style)
+    elements.append(title)
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Datos de la solicitud en tabla
+    data = [
+        ['Campo', 'Valor'],
+        ['Número de Solicitud', f"#{solicitud_data['id']}"],
+        ['Nombre Completo', solicitud_data['nombre']],
+        ['Correo Electrónico', solicitud_data['correo']],
+        ['Tipo de Permiso', solicitud_data['tipo']],
+        ['Fecha de Inicio', solicitud_data['inicio']],
+        ['Fecha de Fin', solicitud_data['fin']],
+        ['Motivo', solicitud_data['motivo']],
+        ['Estado', solicitud_data['estado']],
+        ['Fecha de Creación', solicitud_data['creado_en']],
+    ]
+    
+    table = Table(data, colWidths=[2.5*inch, 4*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('PADDING', (0, 0), (-1, -1), 8),
+    ]))
+    
+    elements.append(table)
+    elements.append(Spacer(1, 0.5*inch))
+    
+    # Nota al pie
+    note = Paragraph(
+        "<i>Este documento es un comprobante de tu solicitud de permiso. "
+        "Guárdalo para futuras referencias.</i>",
+        styles['Normal']
+    )
+    elements.append(note)
+    
+    doc.build(elements)
+    return filename
@@ -0,0 +1,295 @@
+"""
+Esquema compacto de `solicitudes`.
+
+En disco:
+  - `estado` es un entero (ver ESTADOS).
+  - `tipo_id` apunta al diccionario `tipos`; `tipos_alias` mapea cada forma
+    normalizada ("vacaciones", "Vacaciones ", "VACACIONES") a un único tipo.
+  - `inicio`/`fin` son días desde 1970-01-01 y `creado_en` microsegundos desde
+    1970-01-01 (hora local, sin zona), así se conservan exactos los textos ISO.
+
+La vista `solicitudes_v` (y `solicitudes_todas`, que añade el archivo) devuelve
+las mismas columnas de texto que el esquema anterior, de modo que la API, el
+chat y los PDF no cambian.
+"""
+import unicodedata
+from datetime import date, datetime, timedelta
+
+ESTADOS = {'Pendiente': 0, 'Aprobado': 1, 'Rechazado': 2, 'Cancelado': 3}
+ESTADOS_POR_CODIGO = {codigo: nombre for nombre, codigo in ESTADOS.items()}
+
+# Columnas físicas, en el orden de la tabla
+COLUMNAS_FISICAS = ('id', 'nombre', 'correo', 'tipo_id', 'inicio', 'fin', 'motivo',
+                    'estado', 'creado_en', 'comentarios', 'version')
+
+LISTA_FISICAS = ', '.join(COLUMNAS_FISICAS)
+
+MICROS_POR_DIA = 86400 * 1000000
+
+_EPOCA = datetime(1970, 1, 1)
+_EPOCA_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Textos ya decodificados: hay pocos días distintos y como mucho 86400 horas del día
+_fechas = {}
+_horas = {}
+
+
+# --- Conversión Python <-> enteros ---
+
+def codificar_estado(estado):
+    return ESTADOS[estado]
+
+
+def codificar_fecha(iso):
+    """'AAAA-MM-DD' -> días desde 1970-01-01."""
+    if not iso:
+        return None
+    return date.fromisoformat(iso[:10]).toordinal() - _EPOCA_ORDINAL
+
+
+def codificar_instante(iso):
+    """ISO 'AAAA-MM-DDTHH:MM:SS[.ffffff]' -> microsegundos desde 1970-01-01."""
+    if not iso:
+        return None
+    return (datetime.fromisoformat(iso) - _EPOCA) // timedelta(microseconds=1)
+
+
+def decodificar_fecha(dias):
+    """Días desde 1970-01-01 -> 'AAAA-MM-DD'."""
+    if dias is None:
+        return None
+    texto = _fechas.get(dias)
+    if texto is None:
+        texto = _fechas[dias] = date.fromordinal(dias + _EPOCA_ORDINAL).isoformat()
+    return texto
+
+
+def decodificar_instante(micro):
+    """Microsegundos -> ISO, igual que datetime.isoformat() (microsegundos solo si no son cero)."""
+    if micro is None:
+        return None
+    dias, resto = divmod(micro, MICROS_POR_DIA)
+    segundos, micros = divmod(resto, 1000000)
+    hora = _horas.get(segundos)
+    if hora is None:
+        hora = _horas[segundos] = f'{segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}'
+    texto = f'{decodificar_fecha(dias)}T{hora}'
+    return f'{texto}.{micros:06d}' if micros else texto
+
+
+def clave_tipo(texto):
+    """Forma normalizada para alias: sin tildes, minúsculas y espacios simples."""
+    sin_tildes = ''.join(ch for ch in unicodedata.normalize('NFKD', texto or '')
+                         if not unicodedata.combining(ch))
+    return ' '.join(sin_tildes.lower().split())
+
+
+# --- Expresiones SQL que reconstruyen el texto anterior ---
+
+def _sql_fecha(col):
+    return f"date({col} * 86400, 'unixepoch')"
+
+
+def _sql_instante(col):
+    # Igual que datetime.isoformat(): microsegundos solo si no son cero
+    return (f"(strftime('%Y-%m-%dT%H:%M:%S', {col} / 1000000, 'unixepoch') || "
+            f"CASE WHEN {col} % 1000000 THEN printf('.%06d', {col} % 1000000) ELSE '' END)")
+
+
+def _sql_estado(col):
+    casos = ' '.join(f"WHEN {codigo} THEN '{nombre}'" for codigo, nombre in ESTADOS_POR_CODIGO.items())
+    return f'CASE {col} {casos} END'
+
+
+def sql_columnas_legibles(s='s', t='t'):
+    """Lista SELECT con las columnas de texto de siempre, desde la tabla `s` y `tipos` `t`."""
+    return ', '.join((
+        f'{s}.id AS id', f'{s}.nombre AS nombre', f'{s}.correo AS correo',
+        f'{t}.nombre AS tipo',
+        f'{_sql_fecha(f"{s}.inicio")} AS inicio', f'{_sql_fecha(f"{s}.fin")} AS fin',
+        f'{s}.motivo AS motivo', f'{_sql_estado(f"{s}.estado")} AS estado',
+        f'{_sql_instante(f"{s}.creado_en")} AS creado_en',
+        f'{s}.comentarios AS comentarios', f'{s}.version AS version',
+    ))
+
+
+# --- DDL ---
+
+def sql_crear_tabla(nombre, autoincrement=True, extra=()):
+    """DDL de la tabla compacta; `extra` son columnas TEXT adicionales (p. ej. del archivo)."""
+    columnas_extra = ''.join(f',\n      {col} TEXT' for col in extra)
+    return f'''
+      CREATE TABLE IF NOT EXISTS {nombre} (
+      id INTEGER PRIMARY KEY{' AUTOINCREMENT' if autoincrement else ''},
+      nombre TEXT,
+      correo TEXT,
+      tipo_id INTEGER,
+      inicio INTEGER,
+      fin INTEGER,
+      motivo TEXT,
+      estado INTEGER NOT NULL DEFAULT 0,
+      creado_en INTEGER,
+      comentarios TEXT,
+      version INTEGER NOT NULL DEFAULT 0{columnas_extra}
+    )'''
+
+
+def crear_diccionario(c):
+    c.execute('''
+      CREATE TABLE IF NOT EXISTS tipos (
+      id INTEGER PRIMARY KEY,
+      nombre TEXT NOT NULL UNIQUE
+    )''')
+    c.execute('''
+      CREATE TABLE IF NOT EXISTS tipos_alias (
+      alias TEXT PRIMARY KEY,
+      tipo_id INTEGER NOT NULL REFERENCES tipos (id)
+    ) WITHOUT ROWID''')
+
+
+def crear_vista(c):
+    """(Re)crea `solicitudes_v` en la base principal."""
+    c.execute('DROP VIEW IF EXISTS solicitudes_v')
+    c.execute(f'''
+      CREATE VIEW solicitudes_v AS
+      SELECT {sql_columnas_legibles()}
+      FROM solicitudes s LEFT JOIN tipos t ON t.id = s.tipo_id
+    ''')
+
+
+def buscar_tipo(c, texto):
+    """(id, nombre canónico) del tipo si ya está en el diccionario, o (None, None)."""
+    fila = c.execute('SELECT t.id, t.nombre FROM main.tipos_alias a JOIN main.tipos t ON t.id = a.tipo_id '
+                     'WHERE a.alias = ?', (clave_tipo(texto),)).fetchone()
+    return (fila[0], fila[1]) if fila else (None, None)
+
+
+def tipo_id(c, texto):
+    """Devuelve (id, nombre canónico) del tipo, creándolo junto con su alias si es nuevo."""
+    clave = clave_tipo(texto)
+    if not clave:
+        return None, None
+    encontrado = buscar_tipo(c, texto)
+    if encontrado[0] is not None:
+        return encontrado
+    nombre = ' '.join(texto.split()).title()
+    c.execute('INSERT OR IGNORE INTO main.tipos (nombre) VALUES (?)', (nombre,))
+    nuevo_id = c.execute('SELECT id FROM main.tipos WHERE nombre = ?', (nombre,)).fetchone()[0]
+    c.execute('INSERT OR IGNORE INTO main.tipos_alias (alias, tipo_id) VALUES (?, ?)', (clave, nuevo_id))
+    return nuevo_id, nombre
+
+
+def decodificar(c, fila):
+    """Fila física (sqlite3.Row o dict) -> dict con las columnas de texto de siempre."""
+    d = dict(fila)
+    tipo = c.execute('SELECT nombre FROM main.tipos WHERE id = ?', (d.pop('tipo_id'),)).fetchone()
+    d['tipo'] = tipo[0] if tipo else None
+    d['inicio'] = decodificar_fecha(d['inicio'])
+    d['fin'] = decodificar_fecha(d['fin'])
+    d['estado'] = ESTADOS_POR_CODIGO.get(d['estado'])
+    d['creado_en'] = decodificar_instante(d['creado_en'])
+    return d
+
+
+def nombres_tipos(c):
+    """{tipo_id: nombre} del diccionario (son pocas filas)."""
+    return dict(c.execute('SELECT id, nombre FROM main.tipos'))
+
+
+def decodificar_filas(c, filas):
+    """
+    Filas físicas (`SELECT LISTA_FISICAS ...`) -> dicts con las columnas de texto.
+    Para listados: filtrar y ordenar por las columnas enteras y decodificar solo aquí.
+    """
+    tipos = nombres_tipos(c)
+    return [
+        {'id': id_, 'nombre': nombre, 'correo': correo, 'tipo': tipos.get(tipo_id),
+         'inicio': decodificar_fecha(inicio), 'fin': decodificar_fecha(fin), 'motivo': motivo,
+         'estado': ESTADOS_POR_CODIGO.get(estado), 'creado_en': decodificar_instante(creado_en),
+         'comentarios': comentarios, 'version': version}
+        for id_, nombre, correo, tipo_id, inicio, fin, motivo, estado, creado_en, comentarios, version in filas
+    ]
+
+
+# --- Migración desde el esquema de texto ---
+
+def es_esquema_texto(c, base='main'):
+    columnas = [r[1] for r in c.execute(f'PRAGMA {base}.table_info(solicitudes)')]
+    return 'tipo' in columnas and 'tipo_id' not in columnas
+
+
+def migrar(conn, base='main', lote=1000):
+    """
+    Convierte `<base>.solicitudes` del esquema de texto al compacto en una sola
+    transacción. Los tipos se registran en `main.tipos`. Devuelve las filas migradas.
+    Un estado NULL pasa a Pendiente; cualquier otro valor desconocido lanza
+    ValueError y la base queda sin tocar.
+    """
+    c = conn.cursor()
+    if not es_esquema_texto(c, base):
+        return 0
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        # Otro proceso o hilo pudo migrar mientras se esperaba el bloqueo de escritura
+        if not es_esquema_texto(c, base):
+            conn.rollback()
+            return 0
+        columnas = [r[1] for r in c.execute(f'PRAGMA {base}.table_info(solicitudes)')]
+        extra = [col for col in columnas if col not in COLUMNAS_FISICAS and col != 'tipo']
+        autoincrement = base == 'main'
+        secuencia = None
+        if autoincrement:
+            fila = c.execute("SELECT seq FROM main.sqlite_sequence WHERE name = 'solicitudes'").fetchone()
+            secuencia = fila[0] if fila else None
+
+        crear_diccionario(c)
+        if base == 'main':
+            # Se recrea en init_db; si existiera, el RENAME fallaría al validarla
+            c.execute('DROP VIEW IF EXISTS main.solicitudes_v')
+        c.execute(f'DROP TABLE IF EXISTS {base}.solicitudes_compacta')
+        c.execute(sql_crear_tabla(f'{base}.solicitudes_compacta', autoincrement, extra))
+        origen = ['id', 'nombre', 'correo', 'tipo', 'inicio', 'fin', 'motivo', 'estado', 'creado_en']
+        origen += [col for col in ('comentarios', 'version') if col in columnas] + extra
+        destino = [('tipo_id' if col == 'tipo' else col) for col in origen]
+        lectura = conn.execute(f'SELECT {", ".join(origen)} FROM {base}.solicitudes ORDER BY id')
+        total = 0
+        tipos = {}  # texto original -> tipo_id, para no consultar el diccionario por fila
+        while True:
+            filas = lectura.fetchmany(lote)
+            if not filas:
+                break
+            convertidas = []
+            for fila in filas:
+                valores = dict(zip(origen, fila))
+                if valores['tipo'] not in tipos:
+                    tipos[valores['tipo']] = tipo_id(c, valores['tipo'])[0]
+                valores['tipo'] = tipos[valores['tipo']]
+                valores['inicio'] = codificar_fecha(valores['inicio'])
+                valores['fin'] = codificar_fecha(valores['fin'])
+                if valores['estado'] is None:
+                    # Sin estado nunca se decidió: se trata como recién creada
+                    valores['estado'] = ESTADOS['Pendiente']
+                elif valores['estado'] in ESTADOS:
+                    valores['estado'] = ESTADOS[valores['estado']]
+                else:
+                    # No se reescriben datos que no se entienden: la transacción se deshace
+                    raise ValueError(f"Solicitud #{valores['id']} en {base}: estado desconocido "
+                                     f"{valores['estado']!r}; corrígelo antes de migrar")
+                valores['creado_en'] = codificar_instante(valores['creado_en'])
+                if valores.get('version') is None and 'version' in valores:
+                    valores['version'] = 0
+                convertidas.append(tuple(valores[col] for col in origen))
+            c.executemany(
+                f'INSERT INTO {base}.solicitudes_compacta ({", ".join(destino)}) '
+                f'VALUES ({", ".join("?" for _ in destino)})', convertidas)
+            total += len(filas)
+        # Los índices sobre la tabla vieja desaparecen con ella y se recrean en init_db
+        c.execute(f'DROP TABLE {base}.solicitudes')
+        c.execute(f'ALTER TABLE {base}.solicitudes_compacta RENAME TO solicitudes')
+        if secuencia is not None:
+            c.execute("UPDATE main.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'solicitudes'", (secuencia,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return total
@@ -0,0 +1,52 @@
+"""
+Reglas de transición de estado de una solicitud.
+
+Una solicitud nace Pendiente y solo desde ahí puede pasar a Aprobado, Rechazado o
+Cancelado. Cada transición se aplica con un único UPDATE condicionado al estado
+(y opcionalmente a la versión) esperado, así dos administradores, o un
+administrador y un empleado que cancela, no pueden pisarse: el segundo no
+encuentra la fila en el estado esperado y recibe un conflicto.
+"""
+import esquema
+
+ESTADO_INICIAL = 'Pendiente'
+
+TRANSICIONES = {
+    'Pendiente': ('Aprobado', 'Rechazado', 'Cancelado'),
+}
+
+
+def contar_por_estado(c, correo, tabla='solicitudes_todas_fisicas'):
+    """{estado: cantidad} de las solicitudes de `correo`, en una sola consulta sobre el código entero."""
+    conteos = dict.fromkeys(esquema.ESTADOS, 0)
+    for codigo, cantidad in c.execute(
+            f'SELECT estado, COUNT(*) FROM {tabla} WHERE correo = ? GROUP BY estado', (correo,)):
+        conteos[esquema.ESTADOS_POR_CODIGO[codigo]] = cantidad
+    return conteos
+
+
+def transicion_valida(desde, hacia):
+    return hacia in TRANSICIONES.get(desde, ())
+
+
+def transicionar(c, solicitud_id, hacia, desde=ESTADO_INICIAL, version=None, correo=None):
+    """
+    Ejecuta `UPDATE ... WHERE id = ? AND estado = ? [AND version = ?] [AND correo = ?]
+    RETURNING *` e incrementa `version`. Devuelve la fila actualizada (dict con las
+    columnas de texto de siempre) o None si la solicitud no existe o ya no estaba
+    en `desde` (conflicto). Lanza ValueError si la transición no está permitida.
+    El cursor debe devolver filas con nombre (row_factory = sqlite3.Row).
+    """
+    if not transicion_valida(desde, hacia):
+        raise ValueError(f'Transición no permitida: {desde} → {hacia}')
+    sql = 'UPDATE main.solicitudes SET estado = ?, version = version + 1 WHERE id = ? AND estado = ?'
+    params = [esquema.codificar_estado(hacia), solicitud_id, esquema.codificar_estado(desde)]
+    if version is not None:
+        sql += ' AND version = ?'
+        params.append(version)
+    if correo is not None:
+        sql += ' AND correo = ?'
+        params.append(correo)
+    # fetchall: la sentencia con RETURNING debe terminar antes del commit
+    filas = c.execute(sql + ' RETURNING *', params).fetchall()
+    return esquema.decodificar(c, filas[0]) if filas else None
@@ -0,0 +1,160 @@
+"""
+Instantánea de solo lectura para lecturas pesadas (panel de administración, analítica).
+
+La copia se hace con la API de backup en línea de SQLite, solo de la base caliente,
+hacia una base en memoria compartida (o un archivo aparte si se indica `destino`).
+El archivo frío no se copia: crece sin límite y solo cambia con `flask mantenimiento`,
+así que cada conexión lo adjunta en solo lectura desde su archivo. Cada refresco crea
+una generación nueva y la publica de forma atómica; las conexiones abiertas sobre la
+generación anterior siguen funcionando hasta que se cierran.
+
+La instantánea se refresca cada `intervalo` segundos y/o tras `cada_escrituras`
+escrituras avisadas con `registrar_escritura()`. Si al conectar tiene más de
+`max_antiguedad` segundos se pide un refresco en segundo plano, pero se sigue
+sirviendo la copia actual mientras no supere `max_antiguedad_dura`; solo por
+encima de ese límite `conectar()` devuelve None y el llamador lee de la base
+principal.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+import archivo
+
+
+class Instantanea:
+
+    def __init__(self, origen_db, archivo_db, destino=None, max_antiguedad=5.0,
+                 max_antiguedad_dura=60.0, intervalo=0.0, cada_escrituras=0):
+        self.origen_db = origen_db
+        self.archivo_db = archivo_db
+        self.destino = destino
+        self.max_antiguedad = max_antiguedad
+        self.max_antiguedad_dura = max(max_antiguedad_dura, max_antiguedad)
+        self.intervalo = intervalo
+        self.cada_escrituras = cada_escrituras
+
+        self.generacion = 0
+        self.refrescada_en = None
+        self.ultimo_refresco_ms = None
+        self.refrescos = 0
+        self.escrituras_pendientes = 0
+        self._actual = None  # (uri, conexión que mantiene viva la memoria)
+        self._candado = threading.Lock()
+        self._refrescando = threading.Lock()
+        self._hilo = None
+
+    @property
+    def activa(self):
+        return self.max_antiguedad > 0
+
+    def _uri(self, generacion):
+        if self.destino is None:
+            return f'file:instantanea_{id(self)}_{generacion}?mode=memory&cache=shared'
+        # El pid evita que varios workers compartan los mismos archivos
+        return f'file:{os.path.abspath(self.destino)}.{os.getpid()}.{generacion}?mode=rwc'
+
+    def refrescar(self):
+        """Copia la base caliente a una nueva generación y la publica."""
+        with self._refrescando:
+            inicio = time.perf_counter()
+            generacion = self.generacion + 1
+            uri = self._uri(generacion)
+            escrituras = self.escrituras_pendientes
+
+            fuente = sqlite3.connect(self.origen_db)
+            copia = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            fuente.backup(copia)
+            fuente.close()
+
+            with self._candado:
+                anterior = self._actual
+                self._actual = (uri, copia)
+                self.generacion = generacion
+                self.refrescada_en = time.time()
+                self.ultimo_refresco_ms = (time.perf_counter() - inicio) * 1000
+                self.refrescos += 1
+                self.escrituras_pendientes = max(0, self.escrituras_pendientes - escrituras)
+            if anterior:
+                self._descartar(anterior)
+            else:
+                atexit.register(lambda: self._actual and self._descartar(self._actual))
+
+    def _descartar(self, generacion):
+        uri, conexion = generacion
+        conexion.close()
+        if self.destino is not None:
+            try:
+                os.remove(uri[len('file:'):].split('?')[0])
+            except OSError:
+                # En Windows un lector aún puede tener el archivo abierto
+                pass
+
+    def _refrescar_en_segundo_plano(self):
+        if self._refrescando.locked():
+            return
+        threading.Thread(target=self.refrescar, name='instantanea-refresco', daemon=True).start()
+
+    def iniciar(self):
+        """Arranca el refresco periódico si hay `intervalo`."""
+        if self.intervalo > 0 and self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name='instantanea', daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            self.refrescar()
+            time.sleep(self.intervalo)
+
+    def registrar_escritura(self, n=1):
+        """Avisa de escrituras en la base principal; refresca tras `cada_escrituras`."""
+        if not self.activa:
+            return
+        with self._candado:
+            self.escrituras_pendientes += n
+            toca = self.cada_escrituras and self.escrituras_pendientes >= self.cada_escrituras
+        if toca:
+            self._refrescar_en_segundo_plano()
+
+    def edad(self):
+        return None if self.refrescada_en is None else time.time() - self.refrescada_en
+
+    def conectar(self):
+        """
+        Conexión de solo lectura a la instantánea (con `solicitudes_todas`), o None
+        si está desactivada o es más antigua que `max_antiguedad_dura`.
+        """
+        if not self.activa:
+            return None
+        with self._candado:
+            edad = self.edad()
+            usable = self._actual is not None and edad <= self.max_antiguedad_dura
+            if usable:
+                # Abrir bajo el candado: así la generación no se descarta entre medias
+                conn = sqlite3.connect(self._actual[0], uri=True)
+        if not usable or edad > self.max_antiguedad:
+            # Un solo refresco a la vez; mientras tanto se sirve la copia actual
+            self._refrescar_en_segundo_plano()
+        if not usable:
+            return None
+        conn.execute('ATTACH DATABASE ? AS archivo', (f'file:{os.path.abspath(self.archivo_db)}?mode=ro',))
+        # Tras `flask mantenimiento` el archivo puede tener filas que la copia aún ve en main
+        archivo.crear_vista_todas(conn, sin_duplicados=True)
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def metricas(self):
+        edad = self.edad()
+        return {
+            'activa': self.activa,
+            'destino': self.destino or 'memoria',
+            'generacion': self.generacion,
+            'edad_seg': None if edad is None else round(edad, 3),
+            'max_antiguedad_seg': self.max_antiguedad,
+            'max_antiguedad_dura_seg': self.max_antiguedad_dura,
+            'ultimo_refresco_ms': None if self.ultimo_refresco_ms is None else round(self.ultimo_refresco_ms, 3),
+            'refrescos': self.refrescos,
+            'escrituras_pendientes': self.escrituras_pendientes,
+        }
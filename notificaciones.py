@@ -0,0 +1,64 @@
+"""
+Envío de notificaciones por correo (SMTP).
+
+Se importa de forma diferida desde app.py: la pila `email.mime` y `smtplib`
+solo se cargan cuando realmente hay que enviar un correo.
+"""
+import os
+import smtplib
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.base import MIMEBase
+from email import encoders
+
+
+def send_email_notification(to_email, subject, body, pdf_path=None):
+    """
+    Envía correo electrónico real usando SMTP.
+    """
+    # Obtener configuración desde variables de entorno
+    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+    smtp_port = int(os.getenv('SMTP_PORT', '587'))
+    sender_email = os.getenv('SENDER_EMAIL')
+    sender_password = os.getenv('SENDER_PASSWORD')
+    sender_name = os.getenv('SENDER_NAME', 'Sistema de Solicitudes')
+    
+    # Validar que las credenciales estén configuradas
+    if not sender_email or not sender_password or sender_password == 'tu_contraseña_aqui':
+        return False
+    
+    try:
+        # Crear mensaje
+        msg = MIMEMultipart()
+        msg['From'] = f"{sender_name} <{sender_email}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # Agregar cuerpo del mensaje
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        
+        # Adjuntar PDF si existe
+        if pdf_path and os.path.exists(pdf_path):
+            with open(pdf_path, "rb") as attachment:
+                part = MIMEBase("application", "octet-stream")
+                part.set_payload(attachment.read())
+            encoders.encode_base64(part)
+            part.add_header(
+                "Content-Disposition",
+                f"attachment; filename= {os.path.basename(pdf_path)}"
+            )
+            msg.attach(part)
+        
+        # Conectar y enviar
+        server = smtplib.SMTP(smtp_server, smtp_port)
+        server.starttls()
+        server.login(sender_email, sender_password)
+        server.send_message(msg)
+        server.quit()
+        
+        return True
+        
+    except smtplib.SMTPAuthenticationError:
+        return False
+    except Exception as e:
+        return False
@@ -0,0 +1,111 @@
+"""
+Perfilado bajo demanda de peticiones.
+
+Una petición se perfila con cProfile si trae la cabecera `X-Perfilar: <token>` o
+el parámetro `?perfilar=<token>` con el token configurado, o si cae en la fracción
+de muestreo. Sin token configurado solo se perfila por muestreo. Cada
+perfil se guarda en `<directorio>/<id>.prof` (formato pstats) junto con
+`<id>.json` (ruta, paso, duración) para poder listarlos y descargarlos.
+"""
+import cProfile
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+from datetime import datetime
+
+from flask import g, request
+
+
+class Perfilador:
+
+    def __init__(self, directorio, muestreo=0.0, maximo=200, token=None):
+        self.directorio = directorio
+        self.muestreo = muestreo
+        self.maximo = maximo
+        self.token = token
+
+    def activo_para(self, req):
+        """True si la petición pidió perfilado con el token correcto o fue elegida por muestreo."""
+        pedido = req.headers.get('X-Perfilar') or req.args.get('perfilar')
+        if self.token and pedido and hmac.compare_digest(pedido, self.token):
+            return True
+        return self.muestreo > 0 and random.random() < self.muestreo
+
+    def perfilable(self, vista):
+        """
+        Decorador para vistas Flask. La vista puede fijar `g.paso_perfil` para
+        indicar el paso de la conversación que se está perfilando.
+        """
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            if not self.activo_para(request):
+                return vista(*args, **kwargs)
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:
+                # Otro perfilador ya está activo en este hilo
+                return vista(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return vista(*args, **kwargs)
+            finally:
+                perfil.disable()
+                duracion_ms = (time.perf_counter() - inicio) * 1000
+                self._guardar(perfil, request.path, g.get('paso_perfil'), duracion_ms)
+        return envoltura
+
+    def _guardar(self, perfil, ruta, paso, duracion_ms):
+        os.makedirs(self.directorio, exist_ok=True)
+        perfil_id = f"{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        perfil.dump_stats(os.path.join(self.directorio, f'{perfil_id}.prof'))
+        meta = {
+            'id': perfil_id,
+            'ruta': ruta,
+            'paso': paso,
+            'duracion_ms': round(duracion_ms, 3),
+            'creado_en': datetime.now().isoformat(),
+        }
+        with open(os.path.join(self.directorio, f'{perfil_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        self._recortar()
+
+    def _recortar(self):
+        """Conserva solo los `maximo` perfiles más recientes."""
+        ids = sorted(n[:-5] for n in os.listdir(self.directorio) if n.endswith('.json'))
+        for perfil_id in ids[:-self.maximo] if len(ids) > self.maximo else []:
+            for extension in ('.json', '.prof'):
+                ruta = os.path.join(self.directorio, perfil_id + extension)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+
+    def listar(self):
+        """Metadatos de los perfiles guardados, del más reciente al más antiguo."""
+        if not os.path.isdir(self.directorio):
+            return []
+        perfiles = []
+        for nombre in sorted(os.listdir(self.directorio), reverse=True):
+            if nombre.endswith('.json'):
+                with open(os.path.join(self.directorio, nombre), encoding='utf-8') as f:
+                    perfiles.append(json.load(f))
+        return perfiles
+
+    def ruta_perfil(self, perfil_id):
+        """Ruta del .prof o None si no existe (el id no puede salir del directorio)."""
+        if os.path.basename(perfil_id) != perfil_id:
+            return None
+        ruta = os.path.join(self.directorio, f'{perfil_id}.prof')
+        return ruta if os.path.exists(ruta) else None
+
+    def resumen(self, perfil_id, lineas=40):
+        """Texto con las funciones de mayor tiempo acumulado."""
+        salida = io.StringIO()
+        stats = pstats.Stats(self.ruta_perfil(perfil_id), stream=salida)
+        stats.sort_stats('cumulative').print_stats(lineas)
+        return salida.getvalue()